@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
 import environ #type:ignore
 from pathlib import Path #type:ignore
 
@@ -18,4 +19,30 @@ app.conf.update(
     broker_url=redis_url,
     result_backend=redis_url,
     broker_connection_retry_on_startup=True,
-)
\ No newline at end of file
+)
+
+
+@worker_init.connect
+def warm_up_face_models_before_fork(sender=None, **kwargs):
+    from django.conf import settings
+    from Home import worker_resources
+
+    # Before the warm-up, so runtimes initialised here already use the
+    # per-child thread counts.
+    worker_resources.plan(sender)
+
+    if settings.FACE_MODEL_WARMUP == 'parent':
+        from Home.face_models import registry
+        registry.load(trigger='worker_init')
+
+
+@worker_process_init.connect
+def warm_up_face_models_in_child(**kwargs):
+    from django.conf import settings
+    from Home import worker_resources
+
+    worker_resources.apply_to_child()
+
+    if settings.FACE_MODEL_WARMUP == 'child':
+        from Home.face_models import registry
+        registry.load(trigger='worker_process_init')
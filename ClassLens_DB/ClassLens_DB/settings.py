@@ -175,6 +175,14 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Registration waits synchronously for the student's embedding. Set
+# FACE_EMBEDDING_QUEUE (and run a worker with -Q on it) to keep that task
+# from waiting behind attendance jobs; unset, it uses the default queue.
+FACE_EMBEDDING_QUEUE = env('FACE_EMBEDDING_QUEUE', default='')
+CELERY_TASK_ROUTES = {
+    'Home.tasks.compute_face_embedding': {'queue': FACE_EMBEDDING_QUEUE},
+} if FACE_EMBEDDING_QUEUE else {}
+
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = env('EMAIL_HOST')  # e.g., 'smtp.gmail.com' for Gmail
@@ -182,4 +190,151 @@ EMAIL_PORT = env.int('EMAIL_PORT', default=587)  # 587 for TLS, 465 for SSL
 EMAIL_USE_TLS = True  # Use False if using SSL (port 465)
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')  # Your email address
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')  # Your email password/app password
-DEFAULT_FROM_EMAIL = env('EMAIL_HOST_USER')
\ No newline at end of file
+DEFAULT_FROM_EMAIL = env('EMAIL_HOST_USER')
+
+# Attendance pipeline
+ATTENDANCE_MATCH_THRESHOLD = env.float('ATTENDANCE_MATCH_THRESHOLD', default=0.4)
+
+# "numpy" matches in the worker against the enrolled embedding matrix,
+# "database" sends the captured embeddings to pgvector and only gets back
+# the top-k candidates per face.
+ATTENDANCE_MATCHING_BACKEND = env('ATTENDANCE_MATCHING_BACKEND', default='numpy')
+ATTENDANCE_DB_TOP_K = env.int('ATTENDANCE_DB_TOP_K', default=5)
+ATTENDANCE_DB_EF_SEARCH = env.int('ATTENDANCE_DB_EF_SEARCH', default=100)
+
+# Memory-mapped per-subject embedding snapshots, see Home/embedding_store.py
+EMBEDDING_SNAPSHOT_DIR = Path(env('EMBEDDING_SNAPSHOT_DIR', default=str(BASE_DIR / 'embedding_snapshots')))
+
+# Face models, see Home/face_models.py. FACE_MODEL_WARMUP is one of
+# "parent" (load before the Celery pool forks), "child" (load in each pool
+# process) or "lazy" (load on first use).
+GFPGAN_MODEL_PATH = env('GFPGAN_MODEL_PATH', default='GFPGANv1.4.pth')
+FACE_MODEL_WARMUP = env('FACE_MODEL_WARMUP', default='parent')
+
+# Seconds the registration flow waits for the worker to embed a photo.
+FACE_EMBEDDING_TIMEOUT = env.int('FACE_EMBEDDING_TIMEOUT', default=60)
+
+# Face quality gates, see Home/face_quality.py. Faces below the MIN_* gates
+# (or outside the brightness range) are not embedded at all; usable faces
+# smaller or blurrier than the RESTORE_BELOW_* gates go through GFPGAN.
+FACE_QUALITY_MIN_SIZE = env.int('FACE_QUALITY_MIN_SIZE', default=20)
+FACE_QUALITY_MIN_CONFIDENCE = env.float('FACE_QUALITY_MIN_CONFIDENCE', default=0.6)
+FACE_QUALITY_MIN_BRIGHTNESS = env.float('FACE_QUALITY_MIN_BRIGHTNESS', default=25.0)
+FACE_QUALITY_MAX_BRIGHTNESS = env.float('FACE_QUALITY_MAX_BRIGHTNESS', default=235.0)
+FACE_RESTORE_BELOW_SIZE = env.int('FACE_RESTORE_BELOW_SIZE', default=112)
+FACE_RESTORE_BELOW_SHARPNESS = env.float('FACE_RESTORE_BELOW_SHARPNESS', default=100.0)
+
+# Face crops per GFPGAN forward pass, see Home/restoration.py.
+GFPGAN_BATCH_SIZE = env.int('GFPGAN_BATCH_SIZE', default=8)
+
+# Face crops per Facenet512 forward pass, see Home/embedder.py.
+FACENET_BATCH_SIZE = env.int('FACENET_BATCH_SIZE', default=32)
+
+# Face detection, see Home/pipeline.py. In "reduced" mode large photos are
+# JPEG-decoded at 1/2, 1/4 or 1/8 scale for detection, picked so that the
+# smallest expected face (DETECTION_SMALLEST_FACE_FRACTION of the long side)
+# stays at least DETECTION_MIN_FACE_PX wide. Faces smaller than
+# DETECTION_FULL_RES_BELOW_PX in the detection image are cropped from the
+# full-resolution photo, which costs a second, full decode of the photo; the
+# default only does that for back-row faces near DETECTION_MIN_FACE_PX, so
+# photos without such faces are decoded once. "full" detects on the
+# full-resolution photo and "tiled" on overlapping tiles of it.
+DETECTION_MODE = env('DETECTION_MODE', default='reduced')
+DETECTION_SMALLEST_FACE_FRACTION = env.float('DETECTION_SMALLEST_FACE_FRACTION', default=0.012)
+DETECTION_MIN_FACE_PX = env.int('DETECTION_MIN_FACE_PX', default=24)
+DETECTION_FULL_RES_BELOW_PX = env.int('DETECTION_FULL_RES_BELOW_PX', default=48)
+
+# DETECTION_MODE = "tiled" detects on overlapping full-resolution tiles in a
+# thread pool, see Home/tiling.py. The overlap should exceed the largest
+# expected face.
+DETECTION_TILE_SIZE = env.int('DETECTION_TILE_SIZE', default=1280)
+DETECTION_TILE_OVERLAP = env.int('DETECTION_TILE_OVERLAP', default=256)
+DETECTION_TILE_WORKERS = env.int('DETECTION_TILE_WORKERS', default=4)
+
+# Seconds the per-photo progress counters of an attendance job are kept.
+ATTENDANCE_PROGRESS_TTL = env.int('ATTENDANCE_PROGRESS_TTL', default=6 * 60 * 60)
+
+# "chord" runs one Celery task per photo; "pipelined" runs all photos of a
+# session in one task with overlapping decode / inference / output stages.
+ATTENDANCE_EXECUTION = env('ATTENDANCE_EXECUTION', default='chord')
+# Threads per stage and bounded queue size in "pipelined" mode.
+ATTENDANCE_STAGE_WORKERS = {
+    'decode': env.int('ATTENDANCE_DECODE_WORKERS', default=2),
+    'detect': env.int('ATTENDANCE_DETECT_WORKERS', default=1),
+    'restore': env.int('ATTENDANCE_RESTORE_WORKERS', default=1),
+    'embed': env.int('ATTENDANCE_EMBED_WORKERS', default=1),
+    'refine': env.int('ATTENDANCE_REFINE_WORKERS', default=1),
+    'output': env.int('ATTENDANCE_OUTPUT_WORKERS', default=2),
+}
+ATTENDANCE_STAGE_QUEUE_SIZE = env.int('ATTENDANCE_STAGE_QUEUE_SIZE', default=2)
+
+# "native" runs the face models through DeepFace/TensorFlow and PyTorch,
+# "onnx" runs the graphs written by `manage.py export_onnx_models` with ONNX
+# Runtime, see Home/inference.py.
+INFERENCE_BACKEND = env('INFERENCE_BACKEND', default='native')
+ONNX_MODEL_DIR = env('ONNX_MODEL_DIR', default=str(BASE_DIR / 'onnx_models'))
+# 0 uses the worker's per-child thread count (WORKER_CPU_POLICY), or one
+# thread per physical core outside a worker.
+ONNX_INTRA_OP_THREADS = env.int('ONNX_INTRA_OP_THREADS', default=0)
+ONNX_INTER_OP_THREADS = env.int('ONNX_INTER_OP_THREADS', default=1)
+# Use the dynamically int8-quantized Facenet512 graph.
+ONNX_FACENET_INT8 = env.bool('ONNX_FACENET_INT8', default=False)
+
+# CPU layout of Celery workers, see Home/worker_resources.py. "split" divides
+# the cores between prefork children, "fixed" gives every child
+# WORKER_THREADS_PER_CHILD threads and "off" keeps the library defaults.
+WORKER_CPU_POLICY = env('WORKER_CPU_POLICY', default='split')
+WORKER_THREADS_PER_CHILD = env.int('WORKER_THREADS_PER_CHILD', default=1)
+# Pin every prefork child to its own slice of the cores.
+WORKER_CPU_PIN = env.bool('WORKER_CPU_PIN', default=False)
+
+# Cache of detected faces and embeddings per photo, see Home/face_cache.py.
+# One of "disk", "redis" or "off".
+FACE_CACHE_BACKEND = env('FACE_CACHE_BACKEND', default='disk')
+FACE_CACHE_DIR = env('FACE_CACHE_DIR', default=str(BASE_DIR / 'face_cache'))
+FACE_CACHE_MAX_BYTES = env.int('FACE_CACHE_MAX_BYTES', default=512 * 1024 * 1024)
+FACE_CACHE_TTL = env.int('FACE_CACHE_TTL', default=7 * 24 * 60 * 60)
+# Largest Hamming distance between the 256-bit perceptual hashes of two
+# photos of a session with the same dimensions for them to count as
+# near-duplicates; 0 only reuses identical hashes.
+FACE_CACHE_PHASH_DISTANCE = env.int('FACE_CACHE_PHASH_DISTANCE', default=0)
+
+# Seconds the per-photo checkpoints of an unfinished attendance job are kept
+# for a retried or redelivered task to resume from, see Home/checkpoints.py.
+ATTENDANCE_CHECKPOINT_TTL = env.int('ATTENDANCE_CHECKPOINT_TTL', default=24 * 60 * 60)
+# A failing attendance or photo task is retried up to ATTENDANCE_MAX_RETRIES
+# times, ATTENDANCE_RETRY_BACKOFF seconds apart and doubling (with jitter).
+ATTENDANCE_MAX_RETRIES = env.int('ATTENDANCE_MAX_RETRIES', default=3)
+ATTENDANCE_RETRY_BACKOFF = env.int('ATTENDANCE_RETRY_BACKOFF', default=30)
+
+# Two-phase attendance: a fast pass (reduced-resolution detection, no
+# restoration) publishes a provisional present list through attendanceStatus,
+# then faces left unmatched or matched further than
+# ATTENDANCE_REFINE_ABOVE_DISTANCE are restored at full resolution and the
+# photo is matched again. Only the final result is written and notified.
+ATTENDANCE_TWO_PHASE = env.bool('ATTENDANCE_TWO_PHASE', default=False)
+ATTENDANCE_REFINE_ABOVE_DISTANCE = env.float('ATTENDANCE_REFINE_ABOVE_DISTANCE', default=0.3)
+
+# Video attendance, see Home/video.py. Frames are decoded and run through
+# detection at VIDEO_SAMPLE_FPS, up to VIDEO_MAX_FRAMES per video. Faces are
+# linked across sampled frames when their boxes, moved by the estimated
+# camera shift, overlap by VIDEO_TRACK_IOU, and tracks end after
+# VIDEO_TRACK_MAX_MISSES frames unseen.
+VIDEO_SAMPLE_FPS = env.float('VIDEO_SAMPLE_FPS', default=3.0)
+VIDEO_MAX_FRAMES = env.int('VIDEO_MAX_FRAMES', default=180)
+VIDEO_TRACK_IOU = env.float('VIDEO_TRACK_IOU', default=0.3)
+VIDEO_TRACK_MAX_MISSES = env.int('VIDEO_TRACK_MAX_MISSES', default=2)
+
+# Faces unmatched or matched further than ATTENDANCE_SUGGEST_ABOVE_DISTANCE
+# get their ATTENDANCE_SUGGEST_TOP_K nearest enrolled students suggested.
+ATTENDANCE_SUGGEST_TOP_K = env.int('ATTENDANCE_SUGGEST_TOP_K', default=3)
+ATTENDANCE_SUGGEST_ABOVE_DISTANCE = env.float('ATTENDANCE_SUGGEST_ABOVE_DISTANCE', default=0.3)
+
+# Annotated attendance photos are rendered on first request at the smallest
+# of ANNOTATION_WIDTHS covering ?max_width= (ANNOTATION_DEFAULT_WIDTH when
+# omitted) and cached under ANNOTATION_CACHE_DIR, least recently served
+# first out once it exceeds ANNOTATION_CACHE_MAX_BYTES.
+ANNOTATION_WIDTHS = [int(width) for width in env.list('ANNOTATION_WIDTHS', default=['480', '1280', '2560'])]
+ANNOTATION_DEFAULT_WIDTH = env.int('ANNOTATION_DEFAULT_WIDTH', default=1280)
+ANNOTATION_CACHE_DIR = env('ANNOTATION_CACHE_DIR', default=str(MEDIA_ROOT / "annotated"))
+ANNOTATION_CACHE_MAX_BYTES = env.int('ANNOTATION_CACHE_MAX_BYTES', default=512 * 1024 * 1024)
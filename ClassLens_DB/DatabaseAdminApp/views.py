@@ -5,7 +5,6 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.hashers import make_password
 from django.http import HttpResponse
-import pandas as pd
 import io
 from .pagination import StudentPagination
 from Home.models import (
@@ -102,6 +101,8 @@ class TeacherViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def download_template(self, request):
         """Download Excel template for bulk teacher upload"""
+        import pandas as pd
+
         data = {
             'name': ['John Doe', 'Jane Smith'],
             'email': ['john@example.com', 'jane@example.com'],
@@ -127,6 +128,8 @@ class TeacherViewSet(viewsets.ModelViewSet):
         Bulk upload teachers from CSV/Excel
         Expected columns: name, email, password, department_name
         """
+        import pandas as pd
+
         file = request.FILES.get('file')
         if not file:
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
@@ -173,6 +176,8 @@ class StudentViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def download_template(self, request):
         """Download Excel template for bulk student upload"""
+        import pandas as pd
+
         data = {
             'prn': [2021001, 2021002],
             'name': ['Alice Johnson', 'Bob Williams'],
@@ -200,6 +205,8 @@ class StudentViewSet(viewsets.ModelViewSet):
         Bulk upload students from CSV/Excel
         Expected columns: prn, name, email, password, year, department_name
         """
+        import pandas as pd
+
         file = request.FILES.get('file')
         if not file:
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
@@ -246,6 +253,8 @@ class SubjectViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def download_template(self, request):
         """Download Excel template for bulk subject upload"""
+        import pandas as pd
+
         data = {
             'code': ['CS101', 'CS102', 'EE201'],
             'name': ['Data Structures', 'Algorithms', 'Digital Electronics']
@@ -270,6 +279,8 @@ class SubjectViewSet(viewsets.ModelViewSet):
         Bulk upload subjects from CSV/Excel
         Expected columns: code, name
         """
+        import pandas as pd
+
         file = request.FILES.get('file')
         if not file:
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
@@ -310,6 +321,8 @@ class SubjectFromDeptViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def download_template(self, request):
         """Download Excel template for bulk subject-dept mapping upload"""
+        import pandas as pd
+
         data = {
             'department_name': ['Computer Science', 'Electronics'],
             'year': [2, 2],
@@ -347,6 +360,8 @@ class SubjectFromDeptViewSet(viewsets.ModelViewSet):
         Bulk upload subject-dept mappings from CSV/Excel
         Expected columns: department_name, year, semester, subject_codes (comma-separated)
         """
+        import pandas as pd
+
         file = request.FILES.get('file')
         if not file:
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
@@ -393,6 +408,8 @@ class StudentEnrollmentViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def download_template(self, request):
         """Download Excel template for bulk student enrollment upload"""
+        import pandas as pd
+
         data = {
             'student_prn': [2021001, 2021001, 2021002],
             'subject_code': ['CS101', 'CS102', 'EE201']
@@ -427,6 +444,8 @@ class StudentEnrollmentViewSet(viewsets.ModelViewSet):
         Bulk upload student enrollments from CSV/Excel
         Expected columns: student_prn, subject_code
         """
+        import pandas as pd
+
         file = request.FILES.get('file')
         if not file:
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
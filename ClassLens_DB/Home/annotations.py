@@ -0,0 +1,99 @@
+"""
+On-demand annotated attendance photos.
+
+The attendance tasks no longer draw or write any JPEG. The first request for
+a photo's annotated image renders it from the stored SessionFace boxes and
+match status, at the smallest of settings.ANNOTATION_WIDTHS that covers the
+requested width, and keeps the JPEG under settings.ANNOTATION_CACHE_DIR. The
+cached file name carries a digest of the boxes and matches, so a confirmed
+suggestion or a re-match renders afresh. The directory is kept under
+ANNOTATION_CACHE_MAX_BYTES by evicting the least recently served renders.
+
+Only Pillow is used, so this runs in the web process without OpenCV.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+
+from . import disk_lru
+from .models import SessionFace
+
+MATCHED_COLOR = (0, 255, 0)
+UNMATCHED_COLOR = (255, 0, 0)
+
+
+def snap_width(max_width):
+    """
+    The render width for a requested ?max_width=: the smallest configured
+    width at least as large, or the largest one.
+    """
+    widths = sorted(settings.ANNOTATION_WIDTHS)
+    requested = int(max_width) if max_width else settings.ANNOTATION_DEFAULT_WIDTH
+    return next((width for width in widths if width >= requested), widths[-1])
+
+
+def _faces_digest(faces):
+    state = ";".join(
+        f"{face.id},{face.box_x},{face.box_y},{face.box_w},{face.box_h},{face.matched_prn}"
+        for face in faces
+    )
+    return hashlib.sha1(state.encode()).hexdigest()[:12]
+
+
+def annotated_path(photo, max_width):
+    """
+    Path of the annotated JPEG of an AttendancePhotos row at `max_width`,
+    rendering it first if it is not cached yet.
+    """
+    faces = list(SessionFace.objects.filter(photo=photo).only(
+        'id', 'box_x', 'box_y', 'box_w', 'box_h', 'matched_prn'
+    ).order_by('id'))
+    directory = settings.ANNOTATION_CACHE_DIR
+    path = os.path.join(directory, f"photo_{photo.id}_w{max_width}_{_faces_digest(faces)}.jpg")
+    if os.path.exists(path):
+        disk_lru.touch(path)
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    _render(photo.photo.path, faces, max_width, path)
+    disk_lru.evict(directory, ".jpg", settings.ANNOTATION_CACHE_MAX_BYTES)
+    return path
+
+
+def _render(source_path, faces, max_width, output_path):
+    from PIL import Image, ImageDraw, ImageOps
+
+    with Image.open(source_path) as image:
+        # Let libjpeg decode at a reduced scale close to the target first.
+        image.draft('RGB', (max_width, max_width))
+        # The boxes are in the orientation OpenCV decoded the photo in,
+        # which applies the EXIF orientation.
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+        full_width = _original_width(source_path)
+        if image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.BILINEAR)
+        scale = image.width / float(full_width)
+
+        draw = ImageDraw.Draw(image)
+        line = max(2, image.width // 400)
+        for face in faces:
+            x0, y0 = face.box_x * scale, face.box_y * scale
+            x1, y1 = (face.box_x + face.box_w) * scale, (face.box_y + face.box_h) * scale
+            color = MATCHED_COLOR if face.matched_prn is not None else UNMATCHED_COLOR
+            draw.rectangle([x0, y0, x1, y1], outline=color, width=line)
+
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(output_path), suffix=".tmp", delete=False) as tmp:
+            image.save(tmp, format='JPEG', quality=85)
+    os.replace(tmp.name, output_path)
+
+
+def _original_width(source_path):
+    from PIL import Image
+
+    with Image.open(source_path) as header:
+        width, height = header.size
+        orientation = header.getexif().get(0x0112)
+    return height if orientation in (5, 6, 7, 8) else width
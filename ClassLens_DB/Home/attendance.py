@@ -0,0 +1,64 @@
+"""
+Status changes of a marked session's AttendanceRecords.
+
+Every path that changes a session after it was written (a teacher's manual
+correction, catch-up photos, a re-match, confirming a suggested student)
+goes through `apply_status_changes`, so present_count always moves by one
+per record whose status actually changed and only those students are
+notified.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .models import AttendanceRecord, ClassSession, StudentAttendancePercentage
+from .notifications import send_attendance_notifications
+
+
+def apply_status_changes(session, statuses, total_sessions=None, manual=False):
+    """
+    Set the status of the session's records to `statuses` ({student_id:
+    bool}). Records already in the requested state are left alone. With
+    `manual` (a teacher's decision) every listed record is also flagged
+    manually_set, so a later re-match does not undo it. Returns the
+    (student, status) list of the records that changed.
+    """
+    if not statuses:
+        return []
+    if total_sessions is None:
+        total_sessions = ClassSession.objects.filter(subject=session.subject).count()
+
+    with transaction.atomic():
+        records = list(AttendanceRecord.objects.select_for_update().filter(
+            class_session=session,
+            student_id__in=list(statuses),
+        ).select_related('student').defer('student__face_embedding'))
+
+        changed = [record for record in records if record.status != bool(statuses[record.student_id])]
+        for record in changed:
+            record.status = bool(statuses[record.student_id])
+        AttendanceRecord.objects.bulk_update(changed, ['status'])
+        if manual:
+            AttendanceRecord.objects.filter(id__in=[record.id for record in records]).update(manually_set=True)
+
+        for status, delta in ((True, 1), (False, -1)):
+            students = [record.student for record in changed if record.status is status]
+            if students:
+                StudentAttendancePercentage.objects.filter(
+                    student__in=students,
+                    subject=session.subject
+                ).update(present_count=F('present_count') + delta)
+
+        if changed:
+            StudentAttendancePercentage.objects.filter(
+                student__in=[record.student for record in changed],
+                subject=session.subject
+            ).update(attendancePercentage=(F('present_count')*100.0)/total_sessions)
+
+    notification_list = [(record.student, record.status) for record in changed]
+    if notification_list:
+        send_attendance_notifications(
+            notification_list,
+            session.subject.name,
+            session.class_datetime
+        )
+    return notification_list
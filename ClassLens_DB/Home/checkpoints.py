@@ -0,0 +1,35 @@
+"""
+Per-photo checkpoints of attendance jobs.
+
+Once a photo is done its result (faces, matched PRNs, annotated image URL)
+is kept in the shared cache. A job that failed is retried with backoff
+(PIPELINE_RETRY in Home/tasks.py) and one whose worker was killed is
+redelivered (acks_late); either way the photos pick their checkpoint up
+instead of running the face pipeline again, and only the photos that never
+finished are processed.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _key(session_id, photo_id):
+    return f"attendance_checkpoint:{session_id}:{photo_id}"
+
+
+def save_photo(session_id, result):
+    cache.set(
+        _key(session_id, result["photo_id"]),
+        {"result": result},
+        timeout=settings.ATTENDANCE_CHECKPOINT_TTL,
+    )
+
+
+def load_photo(session_id, photo_id):
+    """
+    Checkpoint of a photo as {"result": ...}, or None.
+    """
+    return cache.get(_key(session_id, photo_id))
+
+
+def clear(session_id, photo_ids):
+    cache.delete_many([_key(session_id, photo_id) for photo_id in photo_ids])
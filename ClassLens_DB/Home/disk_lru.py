@@ -0,0 +1,36 @@
+"""
+Size-bounded directories of cache files, evicted least recently used first.
+
+A file's mtime is its last use: readers call `touch` on a hit and writers
+call `evict` after adding a file, which removes the oldest files with the
+given suffix until the directory is back under its byte budget.
+"""
+import os
+
+
+def touch(path):
+    """
+    Mark a cached file as recently used.
+    """
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict(directory, suffix, max_bytes):
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,62 @@
+"""
+Batched Facenet512 embeddings for face crops that are already detected.
+
+DeepFace.represent() runs RetinaFace again on every crop and then Facenet
+with a batch of one. Here the crops are preprocessed exactly the way
+represent() does it (RGB, aspect-preserving resize with padding to the
+model input, scaled to [0, 1]) and Facenet512 runs over them in chunks of
+settings.FACENET_BATCH_SIZE.
+"""
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .face_models import registry
+
+
+def _preprocess(crop_bgr, target_size):
+    from deepface.modules import preprocessing
+
+    rgb = cv2.cvtColor(crop_bgr, cv2.COLOR_BGR2RGB)
+    img = preprocessing.resize_image(img=rgb, target_size=target_size)
+    return preprocessing.normalize_input(img=img, normalization='base')
+
+
+def embed_faces(crops, batch_size=None, models=None):
+    """
+    Embed a list of BGR face crops. Returns a list of the same length holding
+    a float32 embedding per crop, or None where the crop could not be
+    embedded, so callers can map failures back to their facial_area.
+    """
+    if not crops:
+        return []
+
+    facenet = (models or registry).get('facenet512')
+    target_size = (facenet.input_shape[1], facenet.input_shape[0])
+    batch_size = batch_size or settings.FACENET_BATCH_SIZE
+    embeddings = [None] * len(crops)
+
+    prepared = []
+    for index, crop in enumerate(crops):
+        if crop is None or crop.size == 0:
+            continue
+        try:
+            prepared.append((index, _preprocess(crop, target_size)))
+        except Exception:
+            continue
+
+    for start in range(0, len(prepared), batch_size):
+        chunk = prepared[start:start + batch_size]
+        try:
+            batch = np.concatenate([img for _, img in chunk], axis=0)
+            output = np.asarray(facenet.model(batch, training=False), dtype=np.float32)
+            for (index, _), embedding in zip(chunk, output):
+                embeddings[index] = embedding
+        except Exception:
+            for index, img in chunk:
+                try:
+                    embeddings[index] = np.asarray(facenet.model(img, training=False), dtype=np.float32)[0]
+                except Exception:
+                    embeddings[index] = None
+
+    return embeddings
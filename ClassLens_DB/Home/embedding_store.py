@@ -0,0 +1,125 @@
+"""
+Per-subject embedding snapshots shared by all Celery worker processes.
+
+Each subject's enrolled face embeddings are written once as a contiguous,
+pre-normalized float32 .npy matrix (plus a matching PRN array) and every
+worker process memory-maps it read-only, so back-to-back sessions of the same
+subject neither query nor decode the vectors again and prefork children share
+the same pages through the OS page cache.
+
+Snapshots are versioned with a counter kept in the shared cache. The signals
+in Home/signals.py bump the counter of every subject affected by a change to
+Student.face_embedding or StudentEnrollment, and only those subjects are
+rebuilt on their next use.
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .matching import normalize_rows
+from .models import Student, StudentEnrollment
+from .vectors import load_student_embeddings
+
+# Snapshots this process has already mapped: {subject_id: (version, prns, matrix)}
+_mapped = {}
+
+
+def _version_key(subject_id):
+    return f"embedding_snapshot_version:{subject_id}"
+
+
+def current_version(subject_id):
+    """
+    Current snapshot version of a subject. A missing counter (first use or a
+    flushed cache) is seeded from the clock so it never collides with the
+    version of a snapshot file written before.
+    """
+    key = _version_key(subject_id)
+    cache.add(key, time.time_ns(), timeout=None)
+    return cache.get(key)
+
+
+def invalidate_subjects(subject_ids):
+    """
+    Mark the snapshots of the given subjects as stale.
+    """
+    for subject_id in set(subject_ids):
+        key = _version_key(subject_id)
+        if not cache.add(key, time.time_ns(), timeout=None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, time.time_ns(), timeout=None)
+
+
+def _snapshot_paths(subject_id, version):
+    directory = settings.EMBEDDING_SNAPSHOT_DIR
+    stem = f"subject_{subject_id}_v{version}"
+    return directory / f"{stem}.npy", directory / f"{stem}_prns.npy"
+
+
+def _save_atomic(path, array):
+    # A unique temp name: threads of one web or worker process can rebuild
+    # the same stale subject at once.
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False) as f:
+        np.save(f, array)
+    os.replace(f.name, path)
+
+
+def _remove_stale_files(subject_id, version):
+    directory = settings.EMBEDDING_SNAPSHOT_DIR
+    current = {path.name for path in _snapshot_paths(subject_id, version)}
+    for path in directory.glob(f"subject_{subject_id}_v*.npy"):
+        if path.name not in current:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def build_snapshot(subject_id, version):
+    """
+    Query the enrolled embeddings of a subject and write them as the snapshot
+    files for `version`.
+    """
+    enrolled_prns = StudentEnrollment.objects.filter(subject_id=subject_id).values_list('student_prn', flat=True)
+    prns, vectors = load_student_embeddings(Student.objects.filter(prn__in=enrolled_prns).order_by('prn'))
+    matrix = normalize_rows(vectors) if prns else vectors
+
+    settings.EMBEDDING_SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    matrix_path, prns_path = _snapshot_paths(subject_id, version)
+    _save_atomic(prns_path, np.asarray(prns, dtype=np.int64))
+    _save_atomic(matrix_path, np.ascontiguousarray(matrix))
+    _remove_stale_files(subject_id, version)
+
+
+def load_subject_snapshot(subject_id):
+    """
+    Return (prns, matrix) for a subject, where matrix is a read-only
+    memory-mapped float32 array of normalized embeddings, one row per PRN.
+    The snapshot is rebuilt first if it is missing or out of date.
+    """
+    version = current_version(subject_id)
+
+    mapped = _mapped.get(subject_id)
+    if mapped is not None and mapped[0] == version:
+        return mapped[1], mapped[2]
+
+    matrix_path, prns_path = _snapshot_paths(subject_id, version)
+    if not (matrix_path.exists() and prns_path.exists()):
+        build_snapshot(subject_id, version)
+
+    try:
+        prns = np.load(prns_path).tolist()
+        matrix = np.load(matrix_path, mmap_mode='r')
+    except FileNotFoundError:
+        # Another process replaced this version while we were reading it.
+        build_snapshot(subject_id, version)
+        prns = np.load(prns_path).tolist()
+        matrix = np.load(matrix_path, mmap_mode='r')
+    _mapped[subject_id] = (version, prns, matrix)
+    return prns, matrix
@@ -0,0 +1,187 @@
+"""
+Content-addressed cache of the face pipeline's output for a photo.
+
+A photo is keyed by the SHA-256 of its bytes, so a teacher retrying
+markAttendance with the same photos gets the boxes, quality scores and
+embeddings of the first run back without any inference. Within a session,
+a photo with the same dimensions as an already processed one and a 256-bit
+difference hash within settings.FACE_CACHE_PHASH_DISTANCE bits of it (a
+re-shot of the same frame) reuses that photo's entry as well. Only matching
+is re-run, against the current enrollment; the faces stay stored with the
+original photo only.
+
+settings.FACE_CACHE_BACKEND selects the store:
+
+- "disk": one .npz per photo under settings.FACE_CACHE_DIR, evicted least
+  recently used first once the directory exceeds FACE_CACHE_MAX_BYTES.
+- "redis": the Django cache; size and LRU eviction are Redis's own
+  maxmemory / allkeys-lru policy, entries expire after FACE_CACHE_TTL.
+- "off": no caching.
+
+Entries are keyed under a fingerprint of the settings that change the
+pipeline's output, so changing the backend, detection mode or quality
+thresholds never serves stale faces.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from . import disk_lru
+
+# Settings whose value changes what the pipeline produces for a photo.
+_FINGERPRINT_SETTINGS = (
+    "INFERENCE_BACKEND",
+    "ONNX_FACENET_INT8",
+    "DETECTION_MODE",
+    "DETECTION_SMALLEST_FACE_FRACTION",
+    "DETECTION_MIN_FACE_PX",
+    "DETECTION_FULL_RES_BELOW_PX",
+    "DETECTION_TILE_SIZE",
+    "DETECTION_TILE_OVERLAP",
+    "FACE_QUALITY_MIN_SIZE",
+    "FACE_QUALITY_MIN_CONFIDENCE",
+    "FACE_QUALITY_MIN_BRIGHTNESS",
+    "FACE_QUALITY_MAX_BRIGHTNESS",
+    "FACE_RESTORE_BELOW_SIZE",
+    "FACE_RESTORE_BELOW_SHARPNESS",
+    "ATTENDANCE_TWO_PHASE",
+    "ATTENDANCE_REFINE_ABOVE_DISTANCE",
+)
+
+# FaceRecord fields kept in an entry, besides the embedding.
+_FACE_FIELDS = ("facial_area", "landmarks", "confidence", "quality", "decision")
+
+
+def _fingerprint():
+    values = json.dumps([getattr(settings, name, None) for name in _FINGERPRINT_SETTINGS], default=str)
+    return hashlib.sha256(values.encode()).hexdigest()[:12]
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def perceptual_hash(image):
+    """
+    256-bit difference hash of a BGR image: grayscale, 17x16 thumbnail, one
+    bit per horizontally adjacent pair. A 64-bit hash is too coarse for wide
+    classroom shots taken from the same spot but aimed at other rows.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    thumb = cv2.resize(gray, (17, 16), interpolation=cv2.INTER_AREA)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _entry_key(digest):
+    return f"face_cache:{_fingerprint()}:{digest}"
+
+
+def _session_key(session_id):
+    return f"face_cache_near:{_fingerprint()}:{session_id}"
+
+
+def _pack(faces):
+    meta = [{name: getattr(face, name) for name in _FACE_FIELDS} for face in faces]
+    embeddings = np.full((len(faces), 512), np.nan, dtype=np.float32)
+    for row, face in enumerate(faces):
+        if face.embedding is not None:
+            embeddings[row] = face.embedding
+    return meta, embeddings
+
+
+def _unpack(meta, embeddings):
+    return [
+        dict(entry, embedding=None if np.isnan(embedding).any() else embedding)
+        for entry, embedding in zip(meta, embeddings)
+    ]
+
+
+def _disk_path(digest):
+    return os.path.join(settings.FACE_CACHE_DIR, f"{_fingerprint()}_{digest}.npz")
+
+
+def get(digest):
+    """
+    Cached faces of a photo as a list of dicts (the FaceRecord fields plus
+    "embedding"), or None.
+    """
+    backend = settings.FACE_CACHE_BACKEND
+    if backend == "redis":
+        return cache.get(_entry_key(digest))
+    if backend != "disk":
+        return None
+
+    path = _disk_path(digest)
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            faces = _unpack(json.loads(str(data["meta"])), data["embeddings"])
+    except (FileNotFoundError, ValueError, KeyError, OSError):
+        return None
+    disk_lru.touch(path)
+    return faces
+
+
+def put(digest, faces):
+    backend = settings.FACE_CACHE_BACKEND
+    if backend == "redis":
+        meta, embeddings = _pack(faces)
+        cache.set(_entry_key(digest), _unpack(meta, embeddings), timeout=settings.FACE_CACHE_TTL)
+    elif backend == "disk":
+        os.makedirs(settings.FACE_CACHE_DIR, exist_ok=True)
+        meta, embeddings = _pack(faces)
+        # A unique temp name: the output threads of a pipelined job share a
+        # pid and may write the same digest at once.
+        with tempfile.NamedTemporaryFile(dir=settings.FACE_CACHE_DIR, suffix=".tmp", delete=False) as f:
+            np.savez(f, meta=np.array(json.dumps(meta, default=float)), embeddings=embeddings)
+        os.replace(f.name, _disk_path(digest))
+        disk_lru.evict(settings.FACE_CACHE_DIR, ".npz", settings.FACE_CACHE_MAX_BYTES)
+
+
+def _member(size, phash, photo_id, digest):
+    width, height = size
+    return f"{width}x{height}:{phash:064x}:{photo_id}:{digest}"
+
+
+def find_near_duplicate(session_id, phash, size):
+    """
+    (content hash, photo id) of an already processed photo of the session
+    with the same (width, height) `size` and a perceptual hash close enough
+    to `phash`, or None.
+    """
+    if settings.FACE_CACHE_BACKEND == "off":
+        return None
+    limit = settings.FACE_CACHE_PHASH_DISTANCE
+    dimensions = "{}x{}".format(*size)
+    members = get_redis_connection("default").smembers(cache.make_key(_session_key(session_id)))
+    for member in members:
+        other_size, other_phash, photo_id, digest = member.decode().split(":", 3)
+        if other_size == dimensions and bin(int(other_phash, 16) ^ phash).count("1") <= limit:
+            return digest, int(photo_id)
+    return None
+
+
+def remember(session_id, phash, size, photo_id, digest):
+    """
+    Record a processed photo of the session for near-duplicate lookups. The
+    photos of a session are a Redis set, so concurrent evaluate_photo tasks
+    add to it without losing each other's entries.
+    """
+    if settings.FACE_CACHE_BACKEND == "off":
+        return
+    key = cache.make_key(_session_key(session_id))
+    pipe = get_redis_connection("default").pipeline()
+    pipe.sadd(key, _member(size, phash, photo_id, digest))
+    pipe.expire(key, settings.ATTENDANCE_PROGRESS_TTL)
+    pipe.execute()
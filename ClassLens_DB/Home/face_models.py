@@ -0,0 +1,122 @@
+"""
+Registry of the face models used by the attendance pipeline.
+
+Importing this module loads nothing. The models are built on the first call
+to `registry.load()` (or the first access to one of them), which the Celery
+worker signals in ClassLens_DB/celery.py trigger according to
+settings.FACE_MODEL_WARMUP:
+
+- "parent": load in the worker's main process before the pool forks, so
+  prefork children share the weights copy-on-write.
+- "child": load in every pool process from worker_process_init.
+- "lazy": load on first use inside a task.
+
+Which implementation of each model is built (DeepFace/PyTorch or ONNX
+Runtime) is decided by settings.INFERENCE_BACKEND, see Home/inference.py.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import types
+
+from .inference import get_backend
+
+logger = logging.getLogger(__name__)
+
+
+def _patch_torch():
+    # basicsr still imports the module torchvision removed in 0.17, and the
+    # GFPGAN checkpoint needs the pre-2.6 torch.load default.
+    import torch
+    import torchvision.transforms.functional as F
+
+    module_name = 'torchvision.transforms.functional_tensor'
+    if module_name not in sys.modules:
+        functional_tensor_module = types.ModuleType(module_name)
+        functional_tensor_module.rgb_to_grayscale = F.rgb_to_grayscale
+        sys.modules[module_name] = functional_tensor_module
+
+    if getattr(torch.load, '_classlens_patched', False):
+        return
+
+    _original_torch_load = torch.load
+
+    def patched_torch_load(f, *args, **kwargs):
+        if 'weights_only' not in kwargs:
+            kwargs['weights_only'] = False
+        return _original_torch_load(f, *args, **kwargs)
+
+    patched_torch_load._classlens_patched = True
+    torch.load = patched_torch_load
+
+
+class FaceModelRegistry:
+    def __init__(self, backend=None):
+        self._backend_name = backend
+        self._backend = None
+        self._lock = threading.Lock()
+        self._models = {}
+        self._timings = {}
+        self._loaded_in_pid = None
+        self._loaded_by = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = get_backend(self._backend_name)
+        return self._backend
+
+    def load(self, trigger='lazy'):
+        """
+        Build every model that is not loaded yet with the configured
+        inference backend, see Home/inference.py. Safe to call repeatedly.
+        """
+        builders = (
+            ('gfpgan', self.backend.build_restorer),
+            ('retinaface', self.backend.build_detector),
+            ('facenet512', self.backend.build_embedder),
+        )
+        with self._lock:
+            for name, build in builders:
+                if name in self._models:
+                    continue
+                start = time.perf_counter()
+                self._models[name] = build()
+                self._timings[name] = round(time.perf_counter() - start, 3)
+                logger.info(
+                    "Loaded %s (%s) in %.2fs (pid %s, %s)",
+                    name, self.backend.name, self._timings[name], os.getpid(), trigger,
+                )
+            if self._loaded_by is None:
+                self._loaded_in_pid = os.getpid()
+                self._loaded_by = trigger
+        return self
+
+    def get(self, name):
+        if name not in self._models:
+            self.load()
+        return self._models[name]
+
+    @property
+    def restorer(self):
+        return self.get('gfpgan')
+
+    def status(self):
+        """
+        Warm-up state of this process, for health checks and tuning.
+        """
+        return {
+            "pid": os.getpid(),
+            "backend": self.backend.name,
+            "loaded": sorted(self._models),
+            "warm": len(self._models) == 3,
+            "loaded_in_pid": self._loaded_in_pid,
+            "inherited": self._loaded_in_pid is not None and self._loaded_in_pid != os.getpid(),
+            "trigger": self._loaded_by,
+            "load_seconds": dict(self._timings),
+        }
+
+
+registry = FaceModelRegistry()
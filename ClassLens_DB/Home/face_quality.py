@@ -0,0 +1,47 @@
+"""
+Cheap per-face quality estimate used to decide how much work a face gets.
+
+Everything is computed from data the detector already produced: the box
+size from facial_area, the detector confidence and the face crop itself
+(Laplacian variance for sharpness, mean grey level for brightness).
+"""
+import cv2
+import numpy as np
+from django.conf import settings
+
+SKIP = 'skip'
+RESTORE = 'restore'
+KEEP = 'keep'
+
+
+def assess_face(face_crop_bgr, facial_area, confidence):
+    """
+    Return (quality, decision) for one detected face.
+
+    decision is SKIP for faces too small, too uncertain or too badly exposed
+    to embed at all, RESTORE for faces that are usable but small or blurry
+    enough to benefit from GFPGAN, and KEEP for faces that go straight to
+    embedding.
+    """
+    grey = cv2.cvtColor(face_crop_bgr, cv2.COLOR_BGR2GRAY)
+    quality = {
+        "size": int(min(facial_area['w'], facial_area['h'])),
+        "confidence": float(confidence) if confidence is not None else None,
+        "sharpness": float(cv2.Laplacian(grey, cv2.CV_64F).var()),
+        "brightness": float(np.mean(grey)),
+    }
+
+    if (
+        quality["size"] < settings.FACE_QUALITY_MIN_SIZE
+        or (quality["confidence"] is not None and quality["confidence"] < settings.FACE_QUALITY_MIN_CONFIDENCE)
+        or not settings.FACE_QUALITY_MIN_BRIGHTNESS <= quality["brightness"] <= settings.FACE_QUALITY_MAX_BRIGHTNESS
+    ):
+        return quality, SKIP
+
+    if (
+        quality["size"] < settings.FACE_RESTORE_BELOW_SIZE
+        or quality["sharpness"] < settings.FACE_RESTORE_BELOW_SHARPNESS
+    ):
+        return quality, RESTORE
+
+    return quality, KEEP
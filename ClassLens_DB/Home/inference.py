@@ -0,0 +1,202 @@
+"""
+Inference backends for the attendance face models, selected by
+settings.INFERENCE_BACKEND.
+
+- "native": RetinaFace and Facenet512 through DeepFace/TensorFlow and GFPGAN
+  through PyTorch, as built by the libraries themselves.
+- "onnx": the same three networks exported to ONNX by
+  `manage.py export_onnx_models` and run with ONNX Runtime, with the thread
+  counts from settings.ONNX_INTRA_OP_THREADS / ONNX_INTER_OP_THREADS and,
+  when settings.ONNX_FACENET_INT8 is set, the dynamically int8-quantized
+  Facenet graph.
+
+Whatever the backend, the detector has deepface's `detect_faces(image)`, the
+embedder has `input_shape` and `model(batch, training=False)` and the
+restorer has `restore_batch(batch, weight)` on NCHW float32 arrays in
+[-1, 1] and `restore_single(crop, weight)`.
+"""
+import os
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .worker_resources import threads_per_child
+
+ONNX_FILES = {
+    "retinaface": "retinaface.onnx",
+    "facenet512": "facenet512.onnx",
+    "facenet512_int8": "facenet512.int8.onnx",
+    "gfpgan": "gfpgan.onnx",
+}
+
+
+def onnx_path(name):
+    return os.path.join(settings.ONNX_MODEL_DIR, ONNX_FILES[name])
+
+
+class TorchRestorer:
+    """
+    GFPGANer behind the restorer interface.
+    """
+
+    def __init__(self, gfpganer):
+        self.gfpganer = gfpganer
+
+    def restore_batch(self, batch, weight):
+        import torch
+
+        with torch.no_grad():
+            tensor = torch.from_numpy(batch).to(self.gfpganer.device)
+            # Fixed noise, like the exported ONNX graph, so restoration is
+            # deterministic.
+            output = self.gfpganer.gfpgan(tensor, return_rgb=False, weight=weight, randomize_noise=False)[0]
+        return output.cpu().numpy()
+
+    def restore_single(self, crop, weight):
+        _, restored_list, _ = self.gfpganer.enhance(
+            crop,
+            has_aligned=False,
+            only_center_face=True,
+            paste_back=False,
+            weight=weight
+        )
+        return restored_list[0] if restored_list else crop
+
+
+class NativeBackend:
+    name = "native"
+
+    def build_restorer(self):
+        from .face_models import _patch_torch
+
+        _patch_torch()
+        from gfpgan import GFPGANer
+
+        return TorchRestorer(GFPGANer(
+            model_path=settings.GFPGAN_MODEL_PATH,
+            upscale=2,
+            arch='clean',
+            channel_multiplier=2,
+            bg_upsampler=None
+        ))
+
+    def build_detector(self):
+        from deepface import DeepFace
+
+        return DeepFace.build_model(model_name='retinaface', task='face_detector')
+
+    def build_embedder(self):
+        from deepface import DeepFace
+
+        return DeepFace.build_model(model_name='Facenet512', task='facial_recognition')
+
+
+def onnx_session(path):
+    """
+    ONNX Runtime CPU session for `path` with the configured thread counts.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError as exc:
+        raise ImproperlyConfigured("INFERENCE_BACKEND=onnx needs the onnxruntime package.") from exc
+    if not os.path.exists(path):
+        raise ImproperlyConfigured(f"{path} does not exist, run `manage.py export_onnx_models` first.")
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = settings.ONNX_INTRA_OP_THREADS or threads_per_child() or 0
+    options.inter_op_num_threads = settings.ONNX_INTER_OP_THREADS
+    if settings.ONNX_INTER_OP_THREADS > 1:
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+class _EagerOutput:
+    # retina-face calls .numpy() on every output of its Keras model.
+    def __init__(self, array):
+        self.array = array
+
+    def numpy(self):
+        return self.array
+
+
+class OnnxRetinaFaceModel:
+    """
+    Stands in for the Keras RetinaFace model inside deepface's client, so
+    retina-face's own pre- and post-processing (anchors, NMS, landmarks)
+    run unchanged around the ONNX graph.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def __call__(self, im_tensor):
+        outputs = self.session.run(None, {self.input_name: np.asarray(im_tensor, dtype=np.float32)})
+        return [_EagerOutput(output) for output in outputs]
+
+
+class OnnxFacenet:
+    """
+    Facenet512 graph with the attributes of deepface's FaceNet512dClient the
+    embedder uses.
+    """
+    model_name = "Facenet512"
+    input_shape = (160, 160)
+    output_shape = 512
+
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def model(self, batch, training=False):
+        return self.session.run(None, {self.input_name: np.asarray(batch, dtype=np.float32)})[0]
+
+
+class OnnxRestorer:
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def restore_batch(self, batch, weight):
+        # The exported generator is GFPGANv1Clean, which ignores `weight`
+        # just like the PyTorch one.
+        return self.session.run(None, {self.input_name: np.asarray(batch, dtype=np.float32)})[0]
+
+    def restore_single(self, crop, weight):
+        # There is no facexlib re-detection without PyTorch; keep the crop.
+        return crop
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def build_restorer(self):
+        return OnnxRestorer(onnx_session(onnx_path("gfpgan")))
+
+    def build_detector(self):
+        from deepface.models.face_detection.RetinaFace import RetinaFaceClient
+
+        # Skip RetinaFaceClient.__init__, which would build the Keras model.
+        client = RetinaFaceClient.__new__(RetinaFaceClient)
+        client.model = OnnxRetinaFaceModel(onnx_session(onnx_path("retinaface")))
+        return client
+
+    def build_embedder(self):
+        name = "facenet512_int8" if settings.ONNX_FACENET_INT8 else "facenet512"
+        return OnnxFacenet(onnx_session(onnx_path(name)))
+
+
+BACKENDS = {
+    NativeBackend.name: NativeBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def get_backend(name=None):
+    name = name or settings.INFERENCE_BACKEND
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown INFERENCE_BACKEND {name!r}, expected one of {sorted(BACKENDS)}.")
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from Home import pipeline
+from Home.face_models import registry
+
+
+class Command(BaseCommand):
+    help = "Decode and detection time per megapixel for full and reduced detection modes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("photos", nargs="+", help="Paths of classroom photos to benchmark.")
+        parser.add_argument("--modes", nargs="+", default=["full", "reduced"])
+
+    def handle(self, *args, **options):
+        registry.load(trigger='benchmark')
+
+        for path in options["photos"]:
+            img_obj = SimpleNamespace(id=0, photo=SimpleNamespace(path=path))
+            for mode in options["modes"]:
+                with override_settings(DETECTION_MODE=mode):
+                    photo = pipeline.decode(img_obj)
+                    if photo is None:
+                        self.stderr.write(f"Could not decode {path}")
+                        break
+                    faces = pipeline.align(photo, pipeline.detect(photo))
+                    # Crops of small faces come from the full-resolution
+                    # photo, decoded a second time in reduced mode.
+
+                stats = photo.stats()
+                self.stdout.write(
+                    f"{path} [{mode:>7}] {stats['megapixels']:6.1f} MP "
+                    f"1/{stats['reduction']:<4} "
+                    f"decode {stats['decode_ms_per_mp']:8.2f} ms/MP "
+                    f"(+{stats['full_decode_ms_per_mp']:.2f} full) | "
+                    f"detect {stats['detect_ms_per_mp']:8.2f} ms/MP | "
+                    f"{len(faces)} faces"
+                )
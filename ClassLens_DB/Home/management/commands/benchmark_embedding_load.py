@@ -0,0 +1,77 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from pgvector import Vector
+
+from Home.vectors import decode_vectors
+
+
+class Command(BaseCommand):
+    help = "Compare text and binary (vector_send) loading of face embeddings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000])
+        parser.add_argument("--dimensions", type=int, default=512)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument(
+            "--database",
+            action="store_true",
+            help="Also time real round trips through a temporary pgvector table.",
+        )
+
+    def handle(self, *args, **options):
+        dimensions = options["dimensions"]
+        repeat = options["repeat"]
+        rng = np.random.default_rng(0)
+
+        for size in options["sizes"]:
+            vectors = rng.standard_normal((size, dimensions)).astype(np.float32)
+
+            # The exact wire formats Postgres returns for a vector column
+            # (vector_out) and for vector_send(column).
+            texts = ["[" + ",".join(repr(float(v)) for v in row) + "]" for row in vectors]
+            payloads = [Vector(row).to_binary() for row in vectors]
+
+            text_time = self._best_of(repeat, lambda: [Vector._from_db(text) for text in texts])
+            binary_time = self._best_of(repeat, lambda: decode_vectors(payloads, dimensions))
+            self._report(f"decode {size}", text_time, binary_time)
+
+            if options["database"]:
+                text_time, binary_time = self._database_round_trip(vectors, repeat)
+                self._report(f"query+decode {size}", text_time, binary_time)
+
+    def _database_round_trip(self, vectors, repeat):
+        dimensions = vectors.shape[1]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"CREATE TEMP TABLE embedding_bench (prn bigint, face_embedding vector({dimensions})) ON COMMIT DROP")
+            cursor.executemany(
+                "INSERT INTO embedding_bench VALUES (%s, %s::vector)",
+                [(prn, Vector(row).to_text()) for prn, row in enumerate(vectors)],
+            )
+
+            def load_text():
+                cursor.execute("SELECT prn, face_embedding FROM embedding_bench")
+                return [Vector._from_db(embedding) for _, embedding in cursor.fetchall()]
+
+            def load_binary():
+                cursor.execute("SELECT prn, vector_send(face_embedding) FROM embedding_bench")
+                return decode_vectors([payload for _, payload in cursor.fetchall()], dimensions)
+
+            return self._best_of(repeat, load_text), self._best_of(repeat, load_binary)
+
+    def _best_of(self, repeat, fn):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def _report(self, label, text_time, binary_time):
+        self.stdout.write(
+            f"{label:>20}: text {text_time * 1000:9.1f} ms | "
+            f"binary {binary_time * 1000:9.1f} ms | "
+            f"{text_time / binary_time:6.1f}x"
+        )
@@ -0,0 +1,125 @@
+import os
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Home.embedder import embed_faces
+from Home.face_models import FaceModelRegistry
+from Home.matching import cosine_distances, match_faces, normalize_rows
+from Home.pipeline import align_face
+from Home.restoration import _to_image, _to_input
+
+_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+class Command(BaseCommand):
+    help = (
+        "Parity check of the ONNX backend against DeepFace and GFPGAN: restores "
+        "and embeds the faces of a fixture set with both backends and fails if "
+        "any restored crop differs by more than --restore-tolerance grey levels "
+        "on average, any embedding drifts more than --tolerance in cosine "
+        "distance or any match decision at --threshold changes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fixtures", help="Directory of photos with faces.")
+        parser.add_argument("--tolerance", type=float, default=0.01)
+        parser.add_argument("--restore-tolerance", type=float, default=2.0)
+        parser.add_argument("--threshold", type=float, default=None)
+        parser.add_argument(
+            "--subject", type=int, default=None,
+            help="Also compare matches against this subject's enrolled students.",
+        )
+
+    def handle(self, *args, **options):
+        threshold = options["threshold"] or settings.ATTENDANCE_MATCH_THRESHOLD
+        native = FaceModelRegistry(backend='native')
+        onnx = FaceModelRegistry(backend='onnx')
+
+        crops, photo_of_crop, detection_mismatches = [], [], 0
+        for name in sorted(os.listdir(options["fixtures"])):
+            if not name.lower().endswith(_IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(options["fixtures"], name))
+            if image is None:
+                continue
+            # Both backends embed the same crops, from the native detector.
+            regions = native.get('retinaface').detect_faces(image)
+            if len(onnx.get('retinaface').detect_faces(image)) != len(regions):
+                detection_mismatches += 1
+                self.stderr.write(f"{name}: RetinaFace face count differs between backends")
+            for region in regions:
+                area = {"x": region.x, "y": region.y, "w": region.w, "h": region.h}
+                crops.append(align_face(image, area, region.left_eye, region.right_eye))
+                photo_of_crop.append(name)
+
+        if not crops:
+            raise CommandError("No faces found in the fixture set.")
+
+        restore_diff = self._compare_restoration(crops, native, onnx)
+
+        pairs = [
+            (a, b) for a, b in zip(embed_faces(crops, models=native), embed_faces(crops, models=onnx))
+            if a is not None and b is not None
+        ]
+        native_embeddings = np.stack([a for a, _ in pairs])
+        onnx_embeddings = np.stack([b for _, b in pairs])
+
+        drift = 1.0 - np.sum(normalize_rows(native_embeddings) * normalize_rows(onnx_embeddings), axis=1)
+        self.stdout.write(
+            f"{len(pairs)} faces: cosine drift max {drift.max():.5f}, "
+            f"mean {drift.mean():.5f} (tolerance {options['tolerance']})"
+        )
+
+        # Every face against every other face, as a stand-in gallery.
+        native_same = cosine_distances(native_embeddings, normalize_rows(native_embeddings)) < threshold
+        onnx_same = cosine_distances(onnx_embeddings, normalize_rows(onnx_embeddings)) < threshold
+        changed = int(np.count_nonzero(native_same != onnx_same) // 2)
+        self.stdout.write(f"Pairwise decisions changed at {threshold}: {changed}")
+
+        if options["subject"] is not None:
+            changed += self._compare_subject(options["subject"], native_embeddings, onnx_embeddings, threshold)
+
+        failures = []
+        if restore_diff.max() > options["restore_tolerance"]:
+            failures.append("restored crops differ above tolerance")
+        if drift.max() > options["tolerance"]:
+            failures.append("embedding drift above tolerance")
+        if changed:
+            failures.append(f"{changed} match decisions changed")
+        if detection_mismatches:
+            failures.append(f"{detection_mismatches} photos with different face counts")
+        if failures:
+            raise CommandError("; ".join(failures))
+        self.stdout.write(self.style.SUCCESS("ONNX backend matches the native backend."))
+
+    def _compare_restoration(self, crops, native, onnx):
+        # Straight through restore_batch, so a failing backend raises
+        # instead of falling back to the unrestored crop.
+        inputs = np.stack([_to_input(crop) for crop in crops])
+        batch_size = settings.GFPGAN_BATCH_SIZE
+        diffs = []
+        for start in range(0, len(inputs), batch_size):
+            batch = inputs[start:start + batch_size]
+            native_out = native.restorer.restore_batch(batch, 0.1)
+            onnx_out = onnx.restorer.restore_batch(batch, 0.1)
+            for a, b in zip(native_out, onnx_out):
+                diffs.append(np.abs(_to_image(a).astype(np.float32) - _to_image(b).astype(np.float32)).mean())
+        diffs = np.array(diffs)
+        self.stdout.write(
+            f"{len(diffs)} restored crops: mean abs difference max {diffs.max():.3f}, "
+            f"mean {diffs.mean():.3f} grey levels"
+        )
+        return diffs
+
+    def _compare_subject(self, subject_id, native_embeddings, onnx_embeddings, threshold):
+        from Home.embedding_store import load_subject_snapshot
+
+        prns, matrix = load_subject_snapshot(subject_id)
+        native_prns = [r["prn"] for r in match_faces(native_embeddings, prns, matrix, threshold)]
+        onnx_prns = [r["prn"] for r in match_faces(onnx_embeddings, prns, matrix, threshold)]
+        changed = sum(a != b for a, b in zip(native_prns, onnx_prns))
+        self.stdout.write(f"Subject {subject_id} matches changed at {threshold}: {changed}")
+        return changed
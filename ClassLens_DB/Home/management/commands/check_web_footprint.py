@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules that must never be imported by the HTTP process; inference runs on
+# the Celery workers only.
+FORBIDDEN_MODULES = (
+    "torch", "torchvision", "tensorflow", "deepface", "gfpgan", "onnxruntime", "matplotlib", "cv2", "pandas",
+    "scipy",
+)
+
+# Imports what a web worker imports before serving its first request: the
+# WSGI application, the URLconf and through it every view module.
+_WSGI_PROBE = """
+import json, resource, sys
+import ClassLens_DB.wsgi
+from django.conf import settings
+from django.urls import get_resolver
+get_resolver(settings.ROOT_URLCONF).url_patterns
+print(json.dumps({
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": sorted({name.split(".")[0] for name in sys.modules}),
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Regression check for the web tier: times `manage.py check` and the WSGI "
+        "application import in fresh processes, reports their peak RSS and fails "
+        "if the ML stack gets imported or the budgets are exceeded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-seconds", type=float, default=5.0)
+        parser.add_argument("--max-rss-mb", type=float, default=250.0)
+
+    def handle(self, *args, **options):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "ClassLens_DB.settings")}
+        failures = []
+
+        seconds, output = self._run([sys.executable, "manage.py", "check"], env)
+        self._report("manage.py check", seconds, None)
+        if seconds > options["max_seconds"]:
+            failures.append(f"manage.py check took {seconds:.2f}s")
+
+        seconds, output = self._run([sys.executable, "-c", _WSGI_PROBE], env)
+        probe = json.loads(output.strip().splitlines()[-1])
+        rss_mb = probe["max_rss_kb"] / 1024
+        self._report("WSGI import", seconds, rss_mb)
+        if seconds > options["max_seconds"]:
+            failures.append(f"WSGI import took {seconds:.2f}s")
+        if rss_mb > options["max_rss_mb"]:
+            failures.append(f"WSGI import peaked at {rss_mb:.0f} MB RSS")
+
+        loaded = sorted(set(FORBIDDEN_MODULES) & set(probe["modules"]))
+        if loaded:
+            failures.append(f"WSGI import loaded {', '.join(loaded)}")
+
+        if failures:
+            raise CommandError("; ".join(failures))
+        self.stdout.write(self.style.SUCCESS("Web tier footprint OK"))
+
+    def _run(self, command, env):
+        start = time.perf_counter()
+        completed = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        seconds = time.perf_counter() - start
+        if completed.returncode != 0:
+            raise CommandError(f"{' '.join(command[:2])} failed:\n{completed.stderr}")
+        return seconds, completed.stdout
+
+    def _report(self, label, seconds, rss_mb):
+        rss = f" | peak RSS {rss_mb:7.1f} MB" if rss_mb is not None else ""
+        self.stdout.write(f"{label:>16}: {seconds:6.2f} s{rss}")
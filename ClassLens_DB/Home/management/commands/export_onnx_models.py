@@ -0,0 +1,76 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Home.face_models import FaceModelRegistry
+from Home.inference import onnx_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Export RetinaFace, Facenet512 and the GFPGAN generator to ONNX for "
+        "INFERENCE_BACKEND=onnx, plus a dynamically int8-quantized Facenet512."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--opset", type=int, default=17)
+        parser.add_argument("--skip-int8", action="store_true")
+
+    def handle(self, *args, **options):
+        os.makedirs(settings.ONNX_MODEL_DIR, exist_ok=True)
+        native = FaceModelRegistry(backend='native').load(trigger='export')
+        opset = options["opset"]
+
+        import tensorflow as tf
+        import tf2onnx
+
+        tf2onnx.convert.from_keras(
+            native.get('retinaface').model,
+            input_signature=(tf.TensorSpec((None, None, None, 3), tf.float32, name='input'),),
+            opset=opset,
+            output_path=onnx_path('retinaface'),
+        )
+        self.stdout.write(f"Wrote {onnx_path('retinaface')}")
+
+        facenet = native.get('facenet512')
+        height, width = facenet.input_shape[1], facenet.input_shape[0]
+        tf2onnx.convert.from_keras(
+            facenet.model,
+            input_signature=(tf.TensorSpec((None, height, width, 3), tf.float32, name='input'),),
+            opset=opset,
+            output_path=onnx_path('facenet512'),
+        )
+        self.stdout.write(f"Wrote {onnx_path('facenet512')}")
+
+        self._export_gfpgan(native.restorer.gfpganer.gfpgan, opset)
+        self.stdout.write(f"Wrote {onnx_path('gfpgan')}")
+
+        if not options["skip_int8"]:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(onnx_path('facenet512'), onnx_path('facenet512_int8'), weight_type=QuantType.QInt8)
+            self.stdout.write(f"Wrote {onnx_path('facenet512_int8')}")
+
+    def _export_gfpgan(self, net, opset):
+        import torch
+
+        class Generator(torch.nn.Module):
+            # Only the restored image, with fixed noise so the graph is
+            # deterministic.
+            def __init__(self, net):
+                super().__init__()
+                self.net = net
+
+            def forward(self, x):
+                return self.net(x, return_rgb=False, randomize_noise=False)[0]
+
+        torch.onnx.export(
+            Generator(net.eval()),
+            torch.randn(1, 3, 512, 512),
+            onnx_path('gfpgan'),
+            input_names=['input'],
+            output_names=['output'],
+            dynamic_axes={'input': {0: 'batch'}, 'output': {0: 'batch'}},
+            opset_version=opset,
+        )
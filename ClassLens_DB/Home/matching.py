@@ -0,0 +1,155 @@
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Student
+
+# Largest possible cosine distance, used for students the database did not
+# return as candidates for a face.
+_MAX_DISTANCE = 2.0
+
+# Match result of a face that was never matched (skipped or not embeddable).
+UNMATCHED = {"prn": None, "distance": None, "nearest_prn": None, "nearest_distance": None}
+
+# Cost given to face/student pairs that are too far apart to ever be accepted,
+# so the assignment never trades a real match for one above the threshold.
+_REJECT_COST = 1e6
+
+
+def normalize_rows(vectors):
+    """
+    Return a float32 copy of `vectors` with every row scaled to unit length.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def cosine_distances(captured_embeddings, matrix):
+    """
+    Cosine distance between every captured face and every enrolled student,
+    computed with a single matrix product. Shape is (faces, students).
+    """
+    if len(captured_embeddings) == 0 or matrix.shape[0] == 0:
+        return np.zeros((len(captured_embeddings), matrix.shape[0]), dtype=np.float32)
+    return 1.0 - normalize_rows(captured_embeddings) @ matrix.T
+
+
+def assign_faces(distances, threshold):
+    """
+    One-to-one assignment of faces (rows) to students (columns) that minimises
+    the total distance. Returns {face_index: student_index} for pairs under
+    the threshold only.
+    """
+    # Imported here: the web tier imports this module through
+    # session_faces and only needs the assignment solver for a re-match.
+    from scipy.optimize import linear_sum_assignment
+
+    if distances.size == 0:
+        return {}
+    cost = np.where(distances < threshold, distances, _REJECT_COST)
+    rows, cols = linear_sum_assignment(cost)
+    return {
+        int(row): int(col)
+        for row, col in zip(rows, cols)
+        if distances[row, col] < threshold
+    }
+
+
+def match_faces(captured_embeddings, prns, matrix, threshold):
+    """
+    Match the faces of one photo against the enrolled students.
+
+    Every face gets a result dict with the PRN it was assigned to (or None),
+    its assigned distance and its nearest student regardless of assignment, so
+    the caller can both mark attendance and report per-face scores.
+    """
+    distances = cosine_distances(captured_embeddings, matrix)
+    return _results_from_distances(distances, prns, threshold)
+
+
+def _results_from_distances(distances, prns, threshold):
+    assignment = assign_faces(distances, threshold)
+
+    results = []
+    for face_index in range(distances.shape[0]):
+        if distances.shape[1] == 0:
+            results.append(dict(UNMATCHED))
+            continue
+
+        nearest = int(np.argmin(distances[face_index]))
+        has_nearest = distances[face_index, nearest] < _MAX_DISTANCE
+        student_index = assignment.get(face_index)
+        results.append({
+            "prn": prns[student_index] if student_index is not None else None,
+            "distance": float(distances[face_index, student_index]) if student_index is not None else None,
+            "nearest_prn": prns[nearest] if has_nearest else None,
+            "nearest_distance": float(distances[face_index, nearest]) if has_nearest else None,
+        })
+    return results
+
+
+def _vector_literal(embedding):
+    return "[" + ",".join(f"{value:.8g}" for value in np.asarray(embedding, dtype=np.float32)) + "]"
+
+
+def nearest_students_in_db(captured_embeddings, enrolled_prns, top_k):
+    """
+    Top-k nearest enrolled students for every captured face, computed by
+    Postgres in one query. The probes are sent as a VALUES list and each one
+    is ordered by cosine distance in a LATERAL subquery, which lets the
+    student_face_embedding_idx HNSW index serve the ORDER BY ... LIMIT.
+
+    Returns one list of (prn, distance) tuples per face, nearest first.
+    """
+    candidates = [[] for _ in captured_embeddings]
+    if not captured_embeddings or not enrolled_prns:
+        return candidates
+
+    probes = ", ".join(["(%s, %s::vector)"] * len(captured_embeddings))
+    params = []
+    for face_index, embedding in enumerate(captured_embeddings):
+        params.extend([face_index, _vector_literal(embedding)])
+    params.extend([list(enrolled_prns), top_k])
+
+    sql = f"""
+        SELECT probes.face_index, candidate.prn, candidate.distance
+        FROM (VALUES {probes}) AS probes(face_index, embedding)
+        CROSS JOIN LATERAL (
+            SELECT student.prn, student.face_embedding <=> probes.embedding AS distance
+            FROM {Student._meta.db_table} AS student
+            WHERE student.face_embedding IS NOT NULL
+              AND student.prn = ANY(%s)
+            ORDER BY student.face_embedding <=> probes.embedding
+            LIMIT %s
+        ) AS candidate
+        ORDER BY probes.face_index, candidate.distance
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SET LOCAL hnsw.ef_search = %s", [max(settings.ATTENDANCE_DB_EF_SEARCH, top_k)])
+        cursor.execute(sql, params)
+        for face_index, prn, distance in cursor.fetchall():
+            candidates[face_index].append((prn, float(distance)))
+    return candidates
+
+
+def match_faces_in_db(captured_embeddings, enrolled_prns, threshold, top_k):
+    """
+    Same contract as match_faces, but the nearest-neighbour search runs in
+    Postgres and only the top-k candidates per face come back to the worker.
+    The one-to-one assignment is then solved over those candidates.
+    """
+    candidates = nearest_students_in_db(captured_embeddings, enrolled_prns, top_k)
+
+    prns = sorted({prn for face_candidates in candidates for prn, _ in face_candidates})
+    column = {prn: index for index, prn in enumerate(prns)}
+    distances = np.full((len(captured_embeddings), len(prns)), _MAX_DISTANCE, dtype=np.float32)
+    for face_index, face_candidates in enumerate(candidates):
+        for prn, distance in face_candidates:
+            distances[face_index, column[prn]] = distance
+
+    return _results_from_distances(distances, prns, threshold)
@@ -22,6 +22,12 @@ class Teacher(models.Model):
     def __str__(self):
         return self.name
     
+class StudentManager(models.Manager):
+    def get_queryset(self):
+        # Embeddings are read in bulk and in binary through Home.vectors;
+        # keep their text form out of ordinary student row loads.
+        return super().get_queryset().defer('face_embedding')
+
 class Student(models.Model):
     prn = models.BigIntegerField(unique=True, null=False)
     name = models.TextField(null=False)
@@ -34,6 +40,9 @@ class Student(models.Model):
     )
     face_embedding = VectorField(dimensions=512, null=True, blank=True)
     notification_token = models.TextField(null=True, blank=True)
+
+    objects = StudentManager()
+
     class Meta:
         indexes = [
            HnswIndex(
@@ -105,6 +114,9 @@ class AttendanceRecord(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     status = models.BooleanField()
     marked_at = models.DateTimeField(auto_now_add=True)
+    # Set by a teacher's correction or a confirmed suggestion; a re-match
+    # leaves such records alone.
+    manually_set = models.BooleanField(default=False)
 
     class Meta:
         unique_together = ('class_session', 'student')
@@ -112,6 +124,38 @@ class AttendanceRecord(models.Model):
     def __str__(self):
         return f"{self.student.name} - {self.status} for class {self.class_session.id}"
     
+class SessionFaceManager(models.Manager):
+    def get_queryset(self):
+        # Read embeddings in bulk through Home.vectors when they are needed.
+        return super().get_queryset().defer('embedding')
+
+class SessionFace(models.Model):
+    class_session = models.ForeignKey(ClassSession, on_delete=models.CASCADE, related_name='faces')
+    photo = models.ForeignKey(AttendancePhotos, on_delete=models.CASCADE, null=True, blank=True, related_name='faces')
+    box_x = models.IntegerField(null=False)
+    box_y = models.IntegerField(null=False)
+    box_w = models.IntegerField(null=False)
+    box_h = models.IntegerField(null=False)
+    confidence = models.FloatField(null=True, blank=True)
+    quality = models.JSONField(default=dict, blank=True)
+    decision = models.TextField(null=True, blank=True)
+    embedding = VectorField(dimensions=512, null=True, blank=True)
+    matched_prn = models.BigIntegerField(null=True, blank=True)
+    distance = models.FloatField(null=True, blank=True)
+    nearest_prn = models.BigIntegerField(null=True, blank=True)
+    nearest_distance = models.FloatField(null=True, blank=True)
+    # Matched by hand (a confirmed suggestion); a re-match keeps the match.
+    confirmed = models.BooleanField(default=False)
+
+    objects = SessionFaceManager()
+
+    @property
+    def facial_area(self):
+        return {"x": self.box_x, "y": self.box_y, "w": self.box_w, "h": self.box_h}
+
+    def __str__(self):
+        return f"Face {self.id} of class {self.class_session_id} ({self.matched_prn or 'unmatched'})"
+    
 class StudentAttendancePercentage(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     subject=models.ForeignKey(Subject,on_delete=models.CASCADE)
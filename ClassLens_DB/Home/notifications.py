@@ -0,0 +1,46 @@
+import os
+from django.conf import settings
+import firebase_admin
+from firebase_admin import credentials, messaging
+
+def initialize_firebase():
+    if not firebase_admin._apps:
+        cred_path = os.path.join(settings.BASE_DIR, 'firebase-service-account.json')
+        if os.path.exists(cred_path):
+            cred = credentials.Certificate(cred_path)
+            firebase_admin.initialize_app(cred)
+            print("Firebase Admin SDK initialized")
+        else:
+            print(f"Warning: Firebase credentials not found at {cred_path}")
+
+def send_attendance_notifications(student_records, subject_name, class_datetime):
+    """
+    Send push notifications to all students with valid FCM tokens.
+    """
+    initialize_firebase()
+    
+    if not firebase_admin._apps:
+        print("Firebase not initialized, skipping notifications")
+        return
+    
+    for student, is_present in student_records:
+        if student.notification_token:
+            try:
+                status_text = "Present ✓" if is_present else "Absent ✗"
+                message = messaging.Message(
+                    notification=messaging.Notification(
+                        title=f"Attendance Marked - {subject_name}",
+                        body=f"You were marked {status_text} for the class on {class_datetime.strftime('%d %b %Y, %I:%M %p')}",
+                    ),
+                    data={
+                        "type": "attendance",
+                        "subject": subject_name,
+                        "status": "present" if is_present else "absent",
+                        "datetime": class_datetime.isoformat(),
+                    },
+                    token=student.notification_token,
+                )
+                response = messaging.send(message)
+                print(f"Notification sent to {student.name}: {response}")
+            except Exception as e:
+                print(f"Failed to send notification to {student.name}: {e}")
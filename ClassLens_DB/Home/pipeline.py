@@ -0,0 +1,397 @@
+"""
+Stages of the attendance face pipeline.
+
+    decode -> detect -> align -> restore -> embed -> match
+
+or, in two-phase mode, a fast pass without restoration followed by
+
+    match -> refine -> match
+
+RetinaFace runs exactly once per photo in `detect`, on a reduced-scale
+decode of large photos when settings.DETECTION_MODE is "reduced". Its
+boxes, landmarks and confidences become FaceRecord objects in `align`, and
+every later stage works on those records instead of detecting again.
+"""
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import cv2
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .embedder import embed_faces
+from .embedding_store import load_subject_snapshot
+from .face_models import registry
+from .face_quality import RESTORE, SKIP, assess_face
+from .matching import UNMATCHED, match_faces, match_faces_in_db
+from .restoration import restore_faces
+from .tiling import detect_tiled
+
+
+@dataclass
+class FaceRecord:
+    photo_id: int
+    facial_area: dict
+    landmarks: dict
+    confidence: Optional[float]
+    aligned_crop: Optional[np.ndarray] = None
+    restored_crop: Optional[np.ndarray] = None
+    quality: dict = field(default_factory=dict)
+    decision: Optional[str] = None
+    embedding: Optional[np.ndarray] = None
+    match: dict = field(default_factory=lambda: dict(UNMATCHED))
+
+    @property
+    def crop(self):
+        return self.restored_crop if self.restored_crop is not None else self.aligned_crop
+
+    @property
+    def is_present(self):
+        return self.match["prn"] is not None
+
+    def to_result(self):
+        return {
+            "photo_id": self.photo_id,
+            "facial_area": self.facial_area,
+            "quality": self.quality,
+            "decision": self.decision,
+            **self.match,
+        }
+
+
+@dataclass
+class PhotoRecord:
+    photo_id: int
+    image: np.ndarray
+    path: Optional[str] = None
+    scale: float = 1.0
+    full_image: Optional[np.ndarray] = None
+    faces: list = field(default_factory=list)
+    detector_invocations: int = 0
+    megapixels: float = 0.0
+    timings: dict = field(default_factory=dict)
+    # "exact" or "near" when the faces came from the face cache.
+    cache: Optional[str] = None
+    refined_faces: int = 0
+
+    def full_resolution(self):
+        """
+        The photo at full resolution, decoded on first use when detection
+        ran on a reduced image. That second decode is timed as "full_decode".
+        """
+        if self.full_image is None:
+            if self.scale == 1:
+                self.full_image = self.image
+            else:
+                start = time.perf_counter()
+                self.full_image = cv2.imread(self.path)
+                self.timings["full_decode"] = time.perf_counter() - start
+            if self.full_image is None:
+                self.full_image = self.image
+        return self.full_image
+
+    def _ms_per_mp(self, stage):
+        if not self.megapixels:
+            return None
+        return round(self.timings.get(stage, 0.0) * 1000 / self.megapixels, 2)
+
+    def stats(self):
+        return {
+            "photo_id": self.photo_id,
+            "megapixels": round(self.megapixels, 2),
+            "reduction": round(self.scale, 2),
+            "detector_invocations": self.detector_invocations,
+            "cache": self.cache,
+            "refined_faces": self.refined_faces,
+            "decode_ms_per_mp": self._ms_per_mp("decode"),
+            "full_decode_ms_per_mp": self._ms_per_mp("full_decode"),
+            "detect_ms_per_mp": self._ms_per_mp("detect"),
+        }
+
+
+# cv2.imread flags that let libjpeg decode directly at 1/2, 1/4 or 1/8 scale.
+_REDUCED_READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _photo_size(path):
+    """
+    (width, height) of a photo as cv2 will decode it, read from the header
+    only. EXIF orientations 5-8 swap the two sides.
+    """
+    with Image.open(path) as header:
+        width, height = header.size
+        orientation = header.getexif().get(0x0112)
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    return width, height
+
+
+def choose_reduction(width, height, mode=None):
+    """
+    Largest JPEG decode reduction (1, 2, 4 or 8) that still leaves the
+    smallest expected face at least settings.DETECTION_MIN_FACE_PX wide.
+    """
+    if (mode or settings.DETECTION_MODE) != 'reduced':
+        return 1
+    smallest_face = max(width, height) * settings.DETECTION_SMALLEST_FACE_FRACTION
+    for factor in (8, 4, 2):
+        if smallest_face / factor >= settings.DETECTION_MIN_FACE_PX:
+            return factor
+    return 1
+
+
+def decode(img_obj, mode=None):
+    """
+    Read an AttendancePhotos row into a PhotoRecord, or None if the file is
+    missing or unreadable. In "reduced" detection mode the JPEG is decoded
+    straight to a smaller image for detection; the full resolution is only
+    decoded later if some face needs it. `mode` overrides
+    settings.DETECTION_MODE.
+    """
+    path = img_obj.photo.path
+    start = time.perf_counter()
+    try:
+        width, height = _photo_size(path)
+    except Exception:
+        width, height = None, None
+    factor = choose_reduction(width, height, mode) if width else 1
+
+    image = cv2.imread(path, _REDUCED_READ_FLAGS[factor])
+    if image is None:
+        return None
+    if not width:
+        height, width = image.shape[:2]
+
+    photo = PhotoRecord(
+        photo_id=img_obj.id,
+        image=image,
+        path=path,
+        scale=width / image.shape[1],
+        megapixels=width * height / 1e6,
+    )
+    if photo.scale == 1:
+        photo.full_image = image
+    photo.timings["decode"] = time.perf_counter() - start
+    return photo
+
+
+def detect(photo, mode=None):
+    """
+    Run RetinaFace once on the photo's detection image, or once per tile in
+    "tiled" mode. Returns the raw detections, in detection-image coordinates.
+    """
+    detector = registry.get('retinaface')
+    start = time.perf_counter()
+    try:
+        if (mode or settings.DETECTION_MODE) == 'tiled' and max(photo.image.shape[:2]) > settings.DETECTION_TILE_SIZE:
+            detections, tiles = detect_tiled(
+                detector,
+                photo.image,
+                settings.DETECTION_TILE_SIZE,
+                settings.DETECTION_TILE_OVERLAP,
+                settings.DETECTION_TILE_WORKERS,
+            )
+            photo.detector_invocations += tiles
+            return detections
+        photo.detector_invocations += 1
+        return detector.detect_faces(photo.image)
+    except Exception:
+        return []
+    finally:
+        photo.timings["detect"] = photo.timings.get("detect", 0.0) + time.perf_counter() - start
+
+
+def _point(value, scale=1.0):
+    return (int(value[0] * scale), int(value[1] * scale)) if value is not None else None
+
+
+def align_face(image, facial_area, left_eye, right_eye):
+    """
+    Crop a face and rotate it so the eyes are level. The rotation is done on
+    a sub-image twice the size of the box and centred on it, so the corners
+    of the face stay inside the crop.
+    """
+    x, y, w, h = facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h']
+    if left_eye is None or right_eye is None:
+        return image[max(y, 0):y + h, max(x, 0):x + w].copy()
+
+    (x1, y1), (x2, y2) = sorted([left_eye, right_eye])
+    angle = math.degrees(math.atan2(y2 - y1, x2 - x1))
+
+    img_h, img_w = image.shape[:2]
+    sub_x0, sub_y0 = max(x - w // 2, 0), max(y - h // 2, 0)
+    sub_x1, sub_y1 = min(x + w + w // 2, img_w), min(y + h + h // 2, img_h)
+    sub_img = image[sub_y0:sub_y1, sub_x0:sub_x1]
+
+    center = (x - sub_x0 + w / 2, y - sub_y0 + h / 2)
+    rotation = cv2.getRotationMatrix2D(center, angle, 1.0)
+    rotated = cv2.warpAffine(sub_img, rotation, (sub_img.shape[1], sub_img.shape[0]))
+
+    left, top = int(center[0] - w / 2), int(center[1] - h / 2)
+    return rotated[max(top, 0):top + h, max(left, 0):left + w].copy()
+
+
+def align(photo, detections):
+    """
+    Turn raw detections into FaceRecords with an aligned crop, then score
+    each face and decide whether to skip, restore or keep it.
+
+    Boxes and landmarks are mapped back to full-resolution coordinates. A
+    face is cropped from the full-resolution photo when it is smaller than
+    settings.DETECTION_FULL_RES_BELOW_PX in the detection image, so small
+    back-row faces keep their detail; larger faces are cropped from the
+    detection image.
+    """
+    for detection in detections:
+        box = {"x": int(detection.x), "y": int(detection.y), "w": int(detection.w), "h": int(detection.h)}
+        eyes = {name: _point(getattr(detection, name, None)) for name in ("left_eye", "right_eye")}
+
+        facial_area = {key: int(value * photo.scale) for key, value in box.items()}
+        landmarks = {
+            name: _point(getattr(detection, name, None), photo.scale)
+            for name in ("left_eye", "right_eye", "nose", "mouth_left", "mouth_right")
+        }
+        face = FaceRecord(
+            photo_id=photo.photo_id,
+            facial_area=facial_area,
+            landmarks=landmarks,
+            confidence=getattr(detection, 'confidence', None),
+        )
+
+        if photo.scale > 1 and min(box["w"], box["h"]) < settings.DETECTION_FULL_RES_BELOW_PX:
+            face.aligned_crop = align_face(photo.full_resolution(), facial_area, landmarks["left_eye"], landmarks["right_eye"])
+        else:
+            face.aligned_crop = align_face(photo.image, box, eyes["left_eye"], eyes["right_eye"])
+
+        if face.aligned_crop.size == 0:
+            face.decision = SKIP
+        else:
+            face.quality, face.decision = assess_face(face.aligned_crop, facial_area, face.confidence)
+        photo.faces.append(face)
+    return photo.faces
+
+
+def from_cache(photo, cached_faces, kind):
+    """
+    Rebuild the FaceRecords of a photo from a face cache entry instead of
+    running detect, align, restore and embed.
+    """
+    photo.cache = kind
+    photo.faces = [
+        FaceRecord(
+            photo_id=photo.photo_id,
+            facial_area=cached["facial_area"],
+            landmarks=cached["landmarks"],
+            confidence=cached["confidence"],
+            quality=cached["quality"],
+            decision=cached["decision"],
+            embedding=cached["embedding"],
+        )
+        for cached in cached_faces
+    ]
+    return photo.faces
+
+
+def restore(faces):
+    """
+    Batched GFPGAN restoration of the faces marked RESTORE.
+    """
+    to_restore = [face for face in faces if face.decision == RESTORE]
+    for face, restored in zip(to_restore, restore_faces([face.aligned_crop for face in to_restore])):
+        face.restored_crop = restored
+
+
+def embed(faces):
+    """
+    Batched Facenet512 embedding of every face that was not skipped.
+    """
+    to_embed = [face for face in faces if face.decision != SKIP]
+    for face, embedding in zip(to_embed, embed_faces([face.crop for face in to_embed])):
+        face.embedding = embedding
+
+
+def match(photo, matcher):
+    """
+    One-to-one match of the embedded faces of a photo. `matcher` is a
+    callable taking the list of embeddings and returning one match dict per
+    embedding, see match_faces and match_faces_in_db.
+    """
+    embedded = [face for face in photo.faces if face.embedding is not None]
+    for face, result in zip(embedded, matcher([face.embedding for face in embedded])):
+        face.match = result
+    return embedded
+
+
+def refine(photo, above_distance):
+    """
+    Second pass of two-phase mode over the faces the fast pass left
+    unmatched or matched further than `above_distance`: re-crop them from
+    the full-resolution photo, restore them whatever their quality decision
+    and embed them again. Run `match` afterwards to re-assign the photo.
+    """
+    faces = [
+        face for face in photo.faces
+        if face.decision != SKIP
+        and (not face.is_present or face.match["distance"] > above_distance)
+    ]
+    if not faces:
+        return faces
+
+    full_image = photo.full_resolution()
+    for face in faces:
+        face.aligned_crop = align_face(full_image, face.facial_area, face.landmarks["left_eye"], face.landmarks["right_eye"])
+        face.restored_crop = None
+        face.embedding = None
+        face.match = dict(UNMATCHED)
+
+    faces = [face for face in faces if face.aligned_crop.size != 0]
+    for face, restored in zip(faces, restore_faces([face.aligned_crop for face in faces])):
+        face.restored_crop = restored
+    embed(faces)
+    photo.refined_faces += len(faces)
+    return faces
+
+
+def union_snapshot(subject_ids):
+    """
+    (prns, matrix) of the students enrolled in any of the subjects, each
+    student once. A single subject returns its mapped snapshot unchanged.
+    """
+    snapshots = [load_subject_snapshot(subject_id) for subject_id in dict.fromkeys(subject_ids)]
+    if len(snapshots) == 1:
+        return snapshots[0]
+
+    prns, blocks, seen = [], [], set()
+    for subject_prns, matrix in snapshots:
+        rows = [row for row, prn in enumerate(subject_prns) if prn not in seen]
+        seen.update(subject_prns)
+        prns.extend(subject_prns[row] for row in rows)
+        if rows:
+            blocks.append(matrix[rows])
+    if not blocks:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    return prns, np.concatenate(blocks)
+
+
+def make_matcher(subject_ids, enrolled_prns):
+    """
+    Matcher for the students enrolled in the given subjects, using the
+    backend chosen by settings.ATTENDANCE_MATCHING_BACKEND. Combined
+    sessions match against the union of their subjects in one matrix.
+    """
+    threshold = settings.ATTENDANCE_MATCH_THRESHOLD
+    if settings.ATTENDANCE_MATCHING_BACKEND == 'database':
+        top_k = settings.ATTENDANCE_DB_TOP_K
+        return lambda embeddings: match_faces_in_db(embeddings, enrolled_prns, threshold, top_k)
+
+    known_prns, known_matrix = union_snapshot(subject_ids)
+    return lambda embeddings: match_faces(embeddings, known_prns, known_matrix, threshold)
+
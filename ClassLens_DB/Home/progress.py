@@ -0,0 +1,61 @@
+"""
+Progress counters of attendance jobs, shared between the workers that
+update them and the web tier that reports them.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+def progress_key(task_id):
+    return f"attendance_progress:{task_id}"
+
+
+def start_progress(task_id, photo_ids):
+    key = progress_key(task_id)
+    timeout = settings.ATTENDANCE_PROGRESS_TTL
+    cache.set_many(
+        {key: len(photo_ids), f"{key}:done": 0, f"{key}:faces": 0, f"{key}:photos": list(photo_ids)},
+        timeout=timeout,
+    )
+    return key
+
+
+def photo_done(key, num_faces):
+    try:
+        cache.incr(f"{key}:done")
+        cache.incr(f"{key}:faces", num_faces)
+    except ValueError:
+        pass
+
+
+def photo_provisional(key, photo_id, present_prns):
+    """
+    Record the fast-pass matches of a photo in two-phase mode.
+    """
+    cache.set(f"{key}:provisional:{photo_id}", list(present_prns), timeout=settings.ATTENDANCE_PROGRESS_TTL)
+
+
+def get_progress(task_id):
+    """
+    Aggregated progress of the per-photo tasks of an attendance job, or None
+    if the job has not been split into photos yet. In two-phase mode it also
+    carries the provisional present list of the photos whose fast pass is
+    done.
+    """
+    key = progress_key(task_id)
+    values = cache.get_many([key, f"{key}:done", f"{key}:faces", f"{key}:photos"])
+    if key not in values:
+        return None
+    result = {
+        "photos_total": values[key],
+        "photos_done": values.get(f"{key}:done", 0),
+        "num_faces": values.get(f"{key}:faces", 0),
+        "phase": "processing",
+    }
+
+    provisional = cache.get_many([f"{key}:provisional:{photo_id}" for photo_id in values.get(f"{key}:photos", [])])
+    if provisional:
+        result["phase"] = "provisional"
+        result["photos_provisional"] = len(provisional)
+        result["provisional_present_prns"] = sorted({prn for prns in provisional.values() for prn in prns})
+    return result
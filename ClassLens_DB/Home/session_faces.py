@@ -0,0 +1,251 @@
+"""
+Persisted faces of attendance sessions.
+
+Every face the pipeline finds is stored as a SessionFace row with its box,
+quality, Facenet512 embedding and match. A session can then be matched
+again from those rows alone, with another threshold or the current
+enrollment, without loading any model or touching the photos. Faces matched
+by hand (`confirmed`) and records a teacher changed (`manually_set`) keep
+their state through a re-match.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .attendance import apply_status_changes
+from .embedding_store import load_subject_snapshot
+from .matching import cosine_distances, match_faces
+from .models import AttendanceRecord, SessionFace, Student, StudentEnrollment
+from .vectors import annotate_embedding_bytes, decode_vectors
+
+
+class NoStoredFaces(Exception):
+    """
+    The session has no stored faces to re-match, e.g. it was marked before
+    faces were stored or it is a secondary session of a combined job.
+    """
+
+
+class NotEnrolled(Exception):
+    """
+    The student is not enrolled in the session's subject.
+    """
+
+
+def save_faces(session_id, photo_id, faces):
+    """
+    Replace the stored faces of one photo (or of a video, photo_id None)
+    with the given FaceRecords.
+    """
+    rows = [
+        SessionFace(
+            class_session_id=session_id,
+            photo_id=photo_id,
+            box_x=face.facial_area["x"],
+            box_y=face.facial_area["y"],
+            box_w=face.facial_area["w"],
+            box_h=face.facial_area["h"],
+            confidence=float(face.confidence) if face.confidence is not None else None,
+            quality=face.quality,
+            decision=face.decision,
+            embedding=face.embedding,
+            matched_prn=face.match["prn"],
+            distance=face.match["distance"],
+            nearest_prn=face.match["nearest_prn"],
+            nearest_distance=face.match["nearest_distance"],
+        )
+        for face in faces
+    ]
+    with transaction.atomic():
+        SessionFace.objects.filter(class_session_id=session_id, photo_id=photo_id).delete()
+        SessionFace.objects.bulk_create(rows)
+
+
+def load_embeddings(queryset, dimensions=512):
+    """
+    Return (faces, matrix) for the SessionFaces of `queryset` that have an
+    embedding, reading the vectors in binary.
+    """
+    faces = list(annotate_embedding_bytes(queryset.filter(embedding__isnull=False), field='embedding'))
+    return faces, decode_vectors([face.embedding_bytes for face in faces], dimensions)
+
+
+def rematch_session(session, threshold=None):
+    """
+    Match the stored faces of a session again against the subject's current
+    enrollment. Faces are assigned one-to-one per photo, as in the pipeline.
+    Confirmed faces keep their student, who is not matched to any other
+    face. Returns (faces, present_prns); each re-matched face has its new
+    match in `face.match`.
+    """
+    threshold = settings.ATTENDANCE_MATCH_THRESHOLD if threshold is None else threshold
+    known_prns, known_matrix = load_subject_snapshot(session.subject_id)
+    queryset = SessionFace.objects.filter(class_session=session)
+
+    present_prns = set(queryset.filter(confirmed=True).values_list('matched_prn', flat=True))
+    if present_prns:
+        keep = [index for index, prn in enumerate(known_prns) if prn not in present_prns]
+        known_prns, known_matrix = [known_prns[index] for index in keep], known_matrix[keep]
+
+    faces, matrix = load_embeddings(queryset.filter(confirmed=False).order_by('photo_id', 'id'))
+    by_photo = {}
+    for row, face in enumerate(faces):
+        by_photo.setdefault(face.photo_id, []).append(row)
+
+    for rows in by_photo.values():
+        for row, result in zip(rows, match_faces(matrix[rows], known_prns, known_matrix, threshold)):
+            faces[row].match = result
+            if result["prn"] is not None:
+                present_prns.add(result["prn"])
+    return faces, present_prns
+
+
+def apply_rematch(session, faces, present_prns):
+    """
+    Store the new matches of a rematch_session run and bring the session's
+    AttendanceRecords in line with them. Students enrolled since the session
+    was marked get a record; manually set records are not touched. Returns
+    the (student, status) changes.
+    """
+    if not SessionFace.objects.filter(class_session=session).exists():
+        raise NoStoredFaces(f"Session {session.id} has no stored faces to re-match.")
+
+    for face in faces:
+        face.matched_prn = face.match["prn"]
+        face.distance = face.match["distance"]
+        face.nearest_prn = face.match["nearest_prn"]
+        face.nearest_distance = face.match["nearest_distance"]
+    SessionFace.objects.bulk_update(faces, ['matched_prn', 'distance', 'nearest_prn', 'nearest_distance'])
+
+    enrolled_prns = StudentEnrollment.objects.filter(subject=session.subject).values_list('student_prn', flat=True)
+    students = dict(Student.objects.filter(prn__in=enrolled_prns).values_list('id', 'prn'))
+    records = dict(AttendanceRecord.objects.filter(class_session=session).values_list('student_id', 'manually_set'))
+    AttendanceRecord.objects.bulk_create([
+        AttendanceRecord(class_session=session, student_id=student_id, status=False, marked_at=session.class_datetime)
+        for student_id in students
+        if student_id not in records
+    ], ignore_conflicts=True)
+
+    return apply_status_changes(
+        session,
+        {
+            student_id: prn in present_prns
+            for student_id, prn in students.items()
+            if not records.get(student_id, False)
+        },
+    )
+
+
+def timed_rematch(session, threshold=None, apply=False):
+    """
+    rematch_session (and apply_rematch when `apply`), reported for the API.
+    """
+    start = time.perf_counter()
+    faces, present_prns = rematch_session(session, threshold)
+    changes = apply_rematch(session, faces, present_prns) if apply else []
+    return {
+        "class_session_id": session.id,
+        "threshold": settings.ATTENDANCE_MATCH_THRESHOLD if threshold is None else threshold,
+        "num_faces": len(faces),
+        "present_prns": sorted(present_prns),
+        "applied": apply,
+        "changed": [{"prn": student.prn, "status": status} for student, status in changes],
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def suggest_students(session, top_k=None, above_distance=None):
+    """
+    For every stored face of the session that is unmatched or matched
+    further than `above_distance`, the top-k nearest enrolled students with
+    their distances and current status. All faces are scored against the
+    subject's snapshot in one matrix product.
+    """
+    top_k = top_k or settings.ATTENDANCE_SUGGEST_TOP_K
+    above_distance = settings.ATTENDANCE_SUGGEST_ABOVE_DISTANCE if above_distance is None else above_distance
+
+    faces, matrix = load_embeddings(
+        SessionFace.objects.filter(class_session=session).exclude(distance__lte=above_distance).order_by('id')
+    )
+    known_prns, known_matrix = load_subject_snapshot(session.subject_id)
+    if not faces or not known_prns:
+        return []
+
+    distances = cosine_distances(matrix, known_matrix)
+    k = min(top_k, distances.shape[1])
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+    nearest = np.take_along_axis(nearest, order, axis=1)
+
+    candidate_prns = {known_prns[index] for index in nearest.ravel()}
+    students = {
+        prn: (student_id, name)
+        for student_id, prn, name in Student.objects.filter(prn__in=candidate_prns).values_list('id', 'prn', 'name')
+    }
+    present_ids = set(AttendanceRecord.objects.filter(
+        class_session=session, status=True
+    ).values_list('student_id', flat=True))
+
+    suggestions = []
+    for row, face in enumerate(faces):
+        candidates = []
+        for index in nearest[row]:
+            prn = known_prns[index]
+            if prn not in students:
+                continue
+            student_id, name = students[prn]
+            candidates.append({
+                "student_id": student_id,
+                "prn": prn,
+                "name": name,
+                "distance": float(distances[row, index]),
+                "present": student_id in present_ids,
+            })
+        suggestions.append({
+            "face_id": face.id,
+            "photo_id": face.photo_id,
+            "facial_area": face.facial_area,
+            "matched_prn": face.matched_prn,
+            "distance": face.distance,
+            "candidates": candidates,
+        })
+    return suggestions
+
+
+def confirm_suggestion(session, face_id, student_id):
+    """
+    Confirm that a stored face is the given student: record the match and
+    its distance on the face and mark the student present through
+    apply_status_changes. The student the face was matched to before is
+    marked absent in the same call, unless another face of the session
+    still matches them.
+    """
+    face = SessionFace.objects.get(id=face_id, class_session=session)
+    student = Student.objects.get(id=student_id)
+    if not StudentEnrollment.objects.filter(subject=session.subject, student_prn=student.prn).exists():
+        raise NotEnrolled(f"Student {student.prn} is not enrolled in {session.subject.name}.")
+
+    statuses = {student.id: True}
+    previous_prn = face.matched_prn
+    if previous_prn is not None and previous_prn != student.prn:
+        still_matched = SessionFace.objects.filter(
+            class_session=session, matched_prn=previous_prn
+        ).exclude(id=face.id).exists()
+        previous_student_id = Student.objects.filter(prn=previous_prn).values_list('id', flat=True).first()
+        if not still_matched and previous_student_id is not None:
+            statuses[previous_student_id] = False
+
+    distance = None
+    known_prns, known_matrix = load_subject_snapshot(session.subject_id)
+    _, matrix = load_embeddings(SessionFace.objects.filter(id=face.id))
+    if len(matrix) and student.prn in known_prns:
+        column = known_prns.index(student.prn)
+        distance = float(cosine_distances(matrix, known_matrix[column:column + 1])[0, 0])
+
+    face.matched_prn = student.prn
+    face.distance = distance
+    face.confirmed = True
+    face.save(update_fields=['matched_prn', 'distance', 'confirmed'])
+    return apply_status_changes(session, statuses, manual=True)
@@ -0,0 +1,34 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Student, StudentEnrollment
+
+
+def invalidate_subjects(subject_ids):
+    # Imported here so loading the app in the web tier does not pull in the
+    # matching stack (scipy) just to register these receivers.
+    from .embedding_store import invalidate_subjects
+
+    invalidate_subjects(subject_ids)
+
+
+def _subjects_of(prn):
+    return StudentEnrollment.objects.filter(student_prn=prn).values_list('subject_id', flat=True)
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'face_embedding' not in update_fields and 'prn' not in update_fields:
+        return
+    invalidate_subjects(_subjects_of(instance.prn))
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, **kwargs):
+    invalidate_subjects(_subjects_of(instance.prn))
+
+
+@receiver(post_save, sender=StudentEnrollment)
+@receiver(post_delete, sender=StudentEnrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    invalidate_subjects([instance.subject_id])
@@ -0,0 +1,117 @@
+"""
+Bounded producer/consumer pipeline for running the per-photo stages of an
+attendance job concurrently inside one task.
+
+Every stage owns a bounded queue and a pool of worker threads. An item moves
+to the next stage's queue as soon as a stage is done with it, so decoding
+photo N+1 and storing the faces of photo N-1 overlap with inference
+on photo N. The heavy work (OpenCV, NumPy, TensorFlow, torch) releases the
+GIL, so threads are enough and the loaded models are shared.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1, queue_size=2):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox = queue.Queue(maxsize=max(1, queue_size))
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._running = self.workers
+
+    def put(self, item):
+        self.inbox.put(item)
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, self.inbox.qsize())
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "max_queue_depth": self.max_queue_depth,
+            "errors": self.errors,
+        }
+
+
+def _work(stage, next_put):
+    try:
+        _drain(stage, next_put)
+    finally:
+        # Database connections are per thread; close the ones this worker
+        # opened (e.g. the pgvector matcher) instead of leaking them.
+        connections.close_all()
+
+
+def _drain(stage, next_put):
+    while True:
+        item = stage.inbox.get()
+        if item is _DONE:
+            # Wake the sibling workers, and let the last one out close the
+            # next stage.
+            stage.inbox.put(_DONE)
+            with stage._lock:
+                stage._running -= 1
+                last = stage._running == 0
+            if last:
+                next_put(_DONE)
+            return
+
+        start = time.perf_counter()
+        try:
+            result = stage.fn(item)
+        except Exception:
+            logger.exception("Stage %s failed", stage.name)
+            result = None
+            with stage._lock:
+                stage.errors += 1
+        with stage._lock:
+            stage.busy_seconds += time.perf_counter() - start
+
+        if result is not None:
+            next_put(result)
+
+
+def run_stages(items, stages):
+    """
+    Push `items` through `stages` in order. Returns (outputs, stats) where
+    outputs are the non-None results of the last stage, in completion order,
+    and stats maps each stage name to its workers, busy time, largest queue
+    depth and error count. A stage function returning None drops the item.
+    """
+    outputs = []
+    outputs_lock = threading.Lock()
+
+    def collect(item):
+        if item is not _DONE:
+            with outputs_lock:
+                outputs.append(item)
+
+    threads = []
+    for index, stage in enumerate(stages):
+        next_put = stages[index + 1].put if index + 1 < len(stages) else collect
+        for worker in range(stage.workers):
+            thread = threading.Thread(target=_work, args=(stage, next_put), name=f"{stage.name}-{worker}", daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    for item in items:
+        stages[0].put(item)
+    stages[0].put(_DONE)
+
+    for thread in threads:
+        thread.join()
+
+    return outputs, {stage.name: stage.stats() for stage in stages}
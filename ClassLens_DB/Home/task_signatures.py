@@ -0,0 +1,39 @@
+"""
+Celery task names and enqueue helpers for the web tier.
+
+Views enqueue work by task name through this module instead of importing
+Home.tasks, which would pull DeepFace, TensorFlow, torch and OpenCV into
+every web worker.
+"""
+from ClassLens_DB.celery import app
+
+EVALUATE_ATTENDANCE = 'Home.tasks.evaluate_attendance'
+EVALUATE_PHOTO = 'Home.tasks.evaluate_photo'
+FINALIZE_ATTENDANCE = 'Home.tasks.finalize_attendance'
+EVALUATE_ADDED_PHOTOS = 'Home.tasks.evaluate_added_photos'
+MERGE_ATTENDANCE = 'Home.tasks.merge_attendance'
+EVALUATE_VIDEO = 'Home.tasks.evaluate_video'
+EVALUATE_COMBINED = 'Home.tasks.evaluate_combined'
+FINALIZE_COMBINED = 'Home.tasks.finalize_combined'
+COMPUTE_FACE_EMBEDDING = 'Home.tasks.compute_face_embedding'
+FACE_MODEL_STATUS = 'Home.tasks.face_model_status'
+
+
+def evaluate_attendance(total_sessions, class_session_id, scheme, host):
+    return app.send_task(EVALUATE_ATTENDANCE, args=[total_sessions, class_session_id, scheme, host])
+
+
+def evaluate_added_photos(class_session_id, photo_ids, scheme, host):
+    return app.send_task(EVALUATE_ADDED_PHOTOS, args=[class_session_id, photo_ids, scheme, host])
+
+
+def evaluate_combined(class_session_ids, scheme, host):
+    return app.send_task(EVALUATE_COMBINED, args=[class_session_ids, scheme, host])
+
+
+def evaluate_video(total_sessions, class_session_id, video_name):
+    return app.send_task(EVALUATE_VIDEO, args=[total_sessions, class_session_id, video_name])
+
+
+def compute_face_embedding(photo_path):
+    return app.send_task(COMPUTE_FACE_EMBEDDING, args=[photo_path])
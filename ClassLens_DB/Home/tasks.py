@@ -1,237 +1,516 @@
-from celery import shared_task
-import matplotlib.pyplot as plt
-import cv2
+from celery import chord, group, shared_task
 import os
 from rest_framework.response import Response
 from deepface import DeepFace
-import uuid
-import torch
+from PIL import Image
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
 from django.http import request
+from django.urls import reverse
 import numpy as np
-from scipy.spatial.distance import cosine
-import json
-import sys, types
-import torchvision.transforms.functional as F
+from django.db import transaction
 from django.db.models import F as DbF
-import firebase_admin
-from firebase_admin import credentials, messaging
 
-module_name = 'torchvision.transforms.functional_tensor'
+from .models import Student, AttendanceRecord, ClassSession, StudentEnrollment, StudentAttendancePercentage, AttendancePhotos
+from . import checkpoints, face_cache, pipeline, progress, session_faces, stage_runner, video
+from .face_models import registry
+from .attendance import apply_status_changes
+from .notifications import send_attendance_notifications
+from .task_signatures import (
+    COMPUTE_FACE_EMBEDDING, EVALUATE_ADDED_PHOTOS, EVALUATE_ATTENDANCE, EVALUATE_COMBINED, EVALUATE_PHOTO,
+    EVALUATE_VIDEO, FACE_MODEL_STATUS, FINALIZE_ATTENDANCE, FINALIZE_COMBINED, MERGE_ATTENDANCE,
+)
 
-if module_name not in sys.modules:
-    functional_tensor_module = types.ModuleType(module_name)
-    functional_tensor_module.rgb_to_grayscale = F.rgb_to_grayscale
-    sys.modules[module_name] = functional_tensor_module
+# Retry policy of the tasks that run the face pipeline. A retried job picks
+# the photos it already finished up from their checkpoints (see
+# Home/checkpoints.py) and only processes the rest. A missing row will not
+# come back, so that is not retried.
+PIPELINE_RETRY = {
+    "autoretry_for": (Exception,),
+    "dont_autoretry_for": (ObjectDoesNotExist,),
+    "max_retries": settings.ATTENDANCE_MAX_RETRIES,
+    "retry_backoff": settings.ATTENDANCE_RETRY_BACKOFF,
+    "retry_backoff_max": 600,
+    "retry_jitter": True,
+}
 
-_original_torch_load = torch.load
 
-def patched_torch_load(f, *args, **kwargs):
-    if 'weights_only' not in kwargs:
-        kwargs['weights_only'] = False
-    return _original_torch_load(f, *args, **kwargs)
+def enrolled_prns_of(subject_ids):
+    """
+    Sorted PRNs of the students enrolled in any of `subject_ids`.
+    """
+    return sorted(set(StudentEnrollment.objects.filter(
+        subject_id__in=subject_ids
+    ).values_list('student_prn', flat=True)))
 
-torch.load = patched_torch_load
 
-from gfpgan import GFPGANer
-from .models import Student, AttendanceRecord, ClassSession, StudentEnrollment, StudentAttendancePercentage
+def present_prns_of(photo_results):
+    present_prns = set()
+    for photo_result in photo_results:
+        present_prns.update(photo_result["present_prns"])
+    return present_prns
 
-restorer = GFPGANer(
-    model_path='GFPGANv1.4.pth',
-    upscale=2,
-    arch='clean',
-    channel_multiplier=2,
-    bg_upsampler=None
-)
 
-def initialize_firebase():
-    if not firebase_admin._apps:
-        cred_path = os.path.join(settings.BASE_DIR, 'firebase-service-account.json')
-        if os.path.exists(cred_path):
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
-            print("Firebase Admin SDK initialized")
-        else:
-            print(f"Warning: Firebase credentials not found at {cred_path}")
-
-def send_attendance_notifications(student_records, subject_name, class_datetime):
-    """
-    Send push notifications to all students with valid FCM tokens.
-    """
-    initialize_firebase()
-    
-    if not firebase_admin._apps:
-        print("Firebase not initialized, skipping notifications")
-        return
-    
-    for student, is_present in student_records:
-        if student.notification_token:
-            try:
-                status_text = "Present ✓" if is_present else "Absent ✗"
-                message = messaging.Message(
-                    notification=messaging.Notification(
-                        title=f"Attendance Marked - {subject_name}",
-                        body=f"You were marked {status_text} for the class on {class_datetime.strftime('%d %b %Y, %I:%M %p')}",
-                    ),
-                    data={
-                        "type": "attendance",
-                        "subject": subject_name,
-                        "status": "present" if is_present else "absent",
-                        "datetime": class_datetime.isoformat(),
-                    },
-                    token=student.notification_token,
-                )
-                response = messaging.send(message)
-                print(f"Notification sent to {student.name}: {response}")
-            except Exception as e:
-                print(f"Failed to send notification to {student.name}: {e}")
+def summarize_photos(photo_results):
+    """
+    The per-photo part of an attendance result: faces, annotated image URLs
+    and pipeline stats of every photo.
+    """
+    image_urls = [r["image_url"] for r in photo_results if r["image_url"]]
+    faces = [face for r in photo_results for face in r["faces"]]
+    return {
+        "num_faces": len(faces),
+        "image_url": image_urls[0] if image_urls else None,
+        "image_urls": image_urls,
+        "faces": faces,
+        "photos": [r["stats"] for r in photo_results if r["stats"]],
+    }
 
-@shared_task
-def evaluate_attendance(total_sessions,class_session_id:int,scheme, host):
 
-    session = ClassSession.objects.get(id=class_session_id)
-    images=session.photos.all()
-    image_urls=[]
-    total_faces=0
-
-    enrolled_prns = list(StudentEnrollment.objects.filter(
-        subject=session.subject
-    ).values_list('student_prn', flat=True))
-
-    all_students_qs = Student.objects.filter(prn__in=enrolled_prns)
-    
-    student_obj_map = {s.prn: s for s in all_students_qs}
-
-    known_embeddings = {}
-    for s in all_students_qs:
-        if s.face_embedding is not None:
-            emb = s.face_embedding
-            if isinstance(emb, str):
-                emb = json.loads(emb)
-            known_embeddings[s.prn] = emb
-
-    present_student_prns = set()
-    output_dir = settings.MEDIA_ROOT / 'images'
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    for img_obj in images:
-        image_path = img_obj.photo.path
+def write_attendance(session, enrolled_prns, present_student_prns, total_sessions, notify=True):
+    """
+    Create the AttendanceRecords of a session, update every student's
+    attendance percentage for the subject and notify them. Returns the
+    (student, is_present) list that was notified.
+
+    Runs in one transaction holding the session row locked, and does nothing
+    (returning None) if the session already has its records, so a
+    redelivered job can never count a session twice. With notify=False the
+    caller sends the notifications, once its own transaction has committed.
+    """
+    with transaction.atomic():
+        ClassSession.objects.select_for_update().get(id=session.id)
+        if AttendanceRecord.objects.filter(class_session=session).exists():
+            return None
+
+        student_obj_map = {s.prn: s for s in Student.objects.filter(prn__in=enrolled_prns)}
+
+        records_to_create = []
+        student_notification_list = [] 
         
-        if not os.path.exists(image_path):
-            continue
-
-        img_bgr = cv2.imread(image_path)
-        if img_bgr is None:
-            continue
-
-        try:
-            all_face_data = DeepFace.extract_faces(
-                img_path=img_bgr,
-                detector_backend='retinaface',
-                enforce_detection=True,
-                align=True
-            )
-        except Exception:
-            all_face_data = []
-
-        total_faces += len(all_face_data)
-
-        for face_data in all_face_data:
-            face_crop_array = (face_data['face'] * 255).astype(np.uint8)
-            face_crop_bgr = cv2.cvtColor(face_crop_array, cv2.COLOR_RGB2BGR)
-            
-            facial_area = face_data['facial_area']
-            x, y, w, h = facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h']
-
-            _, restored_list, _ = restorer.enhance(
-                face_crop_bgr,
-                has_aligned=False,
-                only_center_face=True,
-                paste_back=False,
-                weight=0.1
-            )
-            face_to_scan = restored_list[0] if restored_list else face_crop_bgr
-
-            face_to_scan_rgb = cv2.cvtColor(face_to_scan, cv2.COLOR_BGR2RGB)
-
-            try:
-                embedding_result = DeepFace.represent(
-                    img_path=face_to_scan_rgb,
-                    model_name='Facenet512',
-                    detector_backend='retinaface',
-                    enforce_detection=False,
-                    align=True
+        for prn in enrolled_prns:
+            student_obj = student_obj_map.get(prn)
+            if student_obj:
+                is_present = prn in present_student_prns
+                records_to_create.append(
+                    AttendanceRecord(
+                        class_session=session,
+                        student=student_obj,
+                        status=is_present,
+                        marked_at=session.class_datetime
+                    )
                 )
-                captured_embedding = embedding_result[0]['embedding']
-            except ValueError:
-                cv2.rectangle(img_bgr, (x, y), (x + w, y + h), (0, 0, 255), 2)
-                continue
-
-            best_score = 1.0
-            best_prn = None
-            
-            for prn, known_emb in known_embeddings.items():
-                print(prn)
-                distance = cosine(known_emb, captured_embedding)
-                if distance < best_score:
-                    best_score = distance
-                    best_prn = prn
-
-            if best_score < 0.4:
-                present_student_prns.add(best_prn)
-                cv2.rectangle(img_bgr, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            else:
-                print(best_score)
-                cv2.rectangle(img_bgr, (x, y), (x + w, y + h), (0, 0, 255), 2)
+                
+                student_notification_list.append((student_obj, is_present))
 
-        unique_id = uuid.uuid4()
-        filename = f"detected_{unique_id}.jpg"
-        save_path = output_dir / filename
-        cv2.imwrite(str(save_path), img_bgr)
-        
-        image_urls.append(f"{scheme}://{host}/media/images/{filename}")
-
-    records_to_create = []
-    student_notification_list = [] 
-    
-    for prn in enrolled_prns:
-        student_obj = student_obj_map.get(prn)
-        if student_obj:
-            is_present = prn in present_student_prns
-            records_to_create.append(
-                AttendanceRecord(
-                    class_session=session,
+                StudentAttendancePercentage.objects.filter(
                     student=student_obj,
-                    status=is_present,
-                    marked_at=session.class_datetime
-                )
-            )
-            
-            student_notification_list.append((student_obj, is_present))
-
-            StudentAttendancePercentage.objects.filter(
-                student=student_obj,
-                subject=session.subject
-            ).update(present_count=DbF('present_count') + (1 if is_present else 0))
-
-            StudentAttendancePercentage.objects.filter(
-                student=student_obj,
-                subject=session.subject
-            ).update(attendancePercentage=(DbF('present_count')*100.0)/total_sessions)
-
-    AttendanceRecord.objects.bulk_create(records_to_create)
-    
-    send_attendance_notifications(
-        student_notification_list,
-        session.subject.name,
-        session.class_datetime
+                    subject=session.subject
+                ).update(present_count=DbF('present_count') + (1 if is_present else 0))
+
+                StudentAttendancePercentage.objects.filter(
+                    student=student_obj,
+                    subject=session.subject
+                ).update(attendancePercentage=(DbF('present_count')*100.0)/total_sessions)
+
+        AttendanceRecord.objects.bulk_create(records_to_create)
+
+    if notify:
+        send_attendance_notifications(
+            student_notification_list,
+            session.subject.name,
+            session.class_datetime
+        )
+    return student_notification_list
+
+
+@shared_task(bind=True, name=EVALUATE_ATTENDANCE, acks_late=True, reject_on_worker_lost=True, **PIPELINE_RETRY)
+def evaluate_attendance(self, total_sessions,class_session_id:int,scheme, host):
+    """
+    Fan an attendance job out as one evaluate_photo task per AttendancePhotos
+    row, joined by a finalize_attendance chord callback. The callback takes
+    over this task's id, so AsyncResult(task_id) resolves to the final result.
+
+    With settings.ATTENDANCE_EXECUTION set to "pipelined" the photos are
+    instead processed here, through a staged pipeline, and the result also
+    carries each stage's busy time and largest queue depth.
+    """
+    session = ClassSession.objects.get(id=class_session_id)
+    photo_ids = list(session.photos.order_by('id').values_list('id', flat=True))
+
+    enrolled_prns = enrolled_prns_of([session.subject_id])
+
+    body = finalize_attendance.s(total_sessions, class_session_id, enrolled_prns)
+    return _evaluate_photos(self, session, photo_ids, enrolled_prns, scheme, host, body)
+
+
+def _evaluate_photos(task, session, photo_ids, enrolled_prns, scheme, host, body, subject_ids=None):
+    """
+    Evaluate the given photos of a session and pass the list of per-photo
+    results to the `body` signature: as a chord that replaces `task`, or
+    directly in this task in "pipelined" mode.
+    """
+    progress_key = progress.start_progress(task.request.id, photo_ids)
+
+    if settings.ATTENDANCE_EXECUTION == 'pipelined':
+        photos = session.photos.filter(id__in=photo_ids).order_by('id')
+        photo_results, stage_stats = _evaluate_pipelined(
+            session, photos, enrolled_prns, scheme, host, progress_key, subject_ids
+        )
+        result = body(photo_results)
+        result["pipeline"] = stage_stats
+        return result
+
+    header = group([
+        evaluate_photo.s(session.id, photo_id, enrolled_prns, scheme, host, progress_key, subject_ids)
+        for photo_id in photo_ids
+    ])
+    return task.replace(chord(header, body))
+
+
+def _photo_steps(session, enrolled_prns, scheme, host, progress_key=None, subject_ids=None):
+    """
+    The per-photo work as (name, function) steps. Each function takes and
+    returns a job dict holding the AttendancePhotos row, its PhotoRecord
+    and the result being built, so the steps can run one after another in
+    evaluate_photo or concurrently in a stage_runner pipeline. Faces are
+    matched against the students of `subject_ids`, by default the session's
+    own subject.
+    """
+    matcher = pipeline.make_matcher(subject_ids or [session.subject_id], enrolled_prns)
+    # Two-phase mode: fast reduced-resolution pass without restoration, then
+    # restoration at full resolution of the doubtful faces only.
+    two_phase = settings.ATTENDANCE_TWO_PHASE
+    detection_mode = 'reduced' if two_phase else None
+
+    def decode(job):
+        img_obj = job["img_obj"]
+        checkpoint = checkpoints.load_photo(session.id, img_obj.id)
+        if checkpoint is not None:
+            # Finished by an earlier delivery of this job.
+            job["result"] = checkpoint["result"]
+            return job
+        if not os.path.exists(img_obj.photo.path):
+            return job
+        job["photo"] = photo = pipeline.decode(img_obj, detection_mode)
+        if photo is None or settings.FACE_CACHE_BACKEND == 'off':
+            return job
+
+        # Photos seen before, byte for byte or as a near-duplicate frame of
+        # this session, skip inference and are only matched again.
+        job["digest"] = face_cache.content_hash(img_obj.photo.path)
+        job["phash"] = face_cache.perceptual_hash(photo.image)
+        job["size"] = (round(photo.image.shape[1] * photo.scale), round(photo.image.shape[0] * photo.scale))
+        cached, kind = face_cache.get(job["digest"]), "exact"
+        if cached is None:
+            near = face_cache.find_near_duplicate(session.id, job["phash"], job["size"])
+            cached, kind = (face_cache.get(near[0]), "near") if near else (None, None)
+            if cached is not None:
+                job["duplicate_of"] = near[1]
+        if cached is not None:
+            pipeline.from_cache(photo, cached, kind)
+        return job
+
+    def needs_inference(job):
+        return job["photo"] is not None and job["photo"].cache is None
+
+    def detect(job):
+        if needs_inference(job):
+            pipeline.align(job["photo"], pipeline.detect(job["photo"], detection_mode))
+        return job
+
+    def restore(job):
+        if needs_inference(job) and not two_phase:
+            pipeline.restore(job["photo"].faces)
+        return job
+
+    def embed(job):
+        if needs_inference(job):
+            pipeline.embed(job["photo"].faces)
+        return job
+
+    def refine(job):
+        photo = job["photo"]
+        if photo is None or not two_phase:
+            return job
+        provisional = [face.match["prn"] for face in pipeline.match(photo, matcher) if face.is_present]
+        if progress_key:
+            progress.photo_provisional(progress_key, photo.photo_id, provisional)
+        if needs_inference(job):
+            pipeline.refine(photo, settings.ATTENDANCE_REFINE_ABOVE_DISTANCE)
+        return job
+
+    def output(job):
+        photo, result = job["photo"], job["result"]
+        if photo is not None:
+            if "digest" in job:
+                if photo.cache is None:
+                    face_cache.put(job["digest"], photo.faces)
+                if "duplicate_of" not in job:
+                    face_cache.remember(session.id, job["phash"], job["size"], photo.photo_id, job["digest"])
+
+            result["present_prns"] = [face.match["prn"] for face in pipeline.match(photo, matcher) if face.is_present]
+            result["stats"] = photo.stats()
+
+            if "duplicate_of" in job:
+                # A re-shot of an earlier photo of the session: its faces are
+                # that photo's, stored and drawn there only.
+                result["duplicate_of"] = job["duplicate_of"]
+                result["image_url"] = f"{scheme}://{host}{reverse('annotated_photo', args=[job['duplicate_of']])}"
+            else:
+                # Rendered on first request from the stored faces, see
+                # Home/annotations.py.
+                result["image_url"] = f"{scheme}://{host}{reverse('annotated_photo', args=[photo.photo_id])}"
+                result["faces"] = [face.to_result() for face in photo.faces]
+                session_faces.save_faces(session.id, photo.photo_id, photo.faces)
+            checkpoints.save_photo(session.id, result)
+            # Drop the decoded images as soon as the photo is done.
+            job["photo"] = None
+
+        if progress_key:
+            progress.photo_done(progress_key, len(result["faces"]))
+        return job
+
+    return [
+        ("decode", decode), ("detect", detect), ("restore", restore), ("embed", embed), ("refine", refine),
+        ("output", output),
+    ]
+
+
+def _photo_job(img_obj):
+    return {
+        "img_obj": img_obj,
+        "photo": None,
+        "result": {"photo_id": img_obj.id, "present_prns": [], "faces": [], "image_url": None, "stats": None},
+    }
+
+
+def _evaluate_pipelined(session, photos, enrolled_prns, scheme, host, progress_key, subject_ids=None):
+    """
+    Run the photos of a session through the stages in this task, with
+    decode, inference and result writing of different photos overlapping.
+    Returns the per-photo results in photo order and the per-stage stats.
+
+    Raises when a photo was lost to a failing stage, like a failed
+    evaluate_photo fails the chord, so attendance is never written without
+    it. The task is then retried (PIPELINE_RETRY), and the photos already
+    done come from their checkpoints instead of being processed again.
+    """
+    photos = list(photos)
+    workers = settings.ATTENDANCE_STAGE_WORKERS
+    stages = [
+        stage_runner.Stage(name, fn, workers=workers.get(name, 1), queue_size=settings.ATTENDANCE_STAGE_QUEUE_SIZE)
+        for name, fn in _photo_steps(session, enrolled_prns, scheme, host, progress_key, subject_ids)
+    ]
+    jobs, stats = stage_runner.run_stages(
+        (_photo_job(img_obj) for img_obj in photos),
+        stages,
     )
+    failed = {name: stage["errors"] for name, stage in stats.items() if stage["errors"]}
+    if failed or len(jobs) != len(photos):
+        raise RuntimeError(
+            f"Pipelined evaluation of session {session.id} finished {len(jobs)} of {len(photos)} photos "
+            f"(stage errors: {failed})."
+        )
+    photo_results = sorted((job["result"] for job in jobs), key=lambda r: r["photo_id"])
+    return photo_results, stats
+
+
+@shared_task(name=EVALUATE_PHOTO, acks_late=True, reject_on_worker_lost=True, **PIPELINE_RETRY)
+def evaluate_photo(class_session_id, photo_id, enrolled_prns, scheme, host, progress_key=None, subject_ids=None):
+    """
+    Detect, embed and match the faces of one AttendancePhotos row.
+    """
+    session = ClassSession.objects.get(id=class_session_id)
+    job = _photo_job(AttendancePhotos.objects.get(id=photo_id))
+    for _, step in _photo_steps(session, enrolled_prns, scheme, host, progress_key, subject_ids):
+        job = step(job)
+    return job["result"]
+
+
+@shared_task(name=FINALIZE_ATTENDANCE, acks_late=True, reject_on_worker_lost=True)
+def finalize_attendance(photo_results, total_sessions, class_session_id, enrolled_prns):
+    """
+    Chord callback: union the present PRNs of every photo and write the
+    session's attendance exactly once, even when redelivered.
+    """
+    session = ClassSession.objects.get(id=class_session_id)
+
+    present_student_prns = present_prns_of(photo_results)
+
+    write_attendance(session, enrolled_prns, present_student_prns, total_sessions)
+    checkpoints.clear(class_session_id, [r["photo_id"] for r in photo_results])
 
     return {
-        "num_faces": total_faces,
-        "image_url": image_urls[0] if image_urls else None,
+        **summarize_photos(photo_results),
         "class_session_id": class_session_id,
         "present_count": len(present_student_prns),
         "absent_count": len(enrolled_prns) - len(present_student_prns),
-        "subject": session.subject.name
-    }
\ No newline at end of file
+        "subject": session.subject.name,
+    }
+
+
+@shared_task(bind=True, name=EVALUATE_ADDED_PHOTOS, acks_late=True, reject_on_worker_lost=True, **PIPELINE_RETRY)
+def evaluate_added_photos(self, class_session_id, photo_ids, scheme, host):
+    """
+    Evaluate photos added to a session that already has its attendance and
+    merge the students they find into it with merge_attendance.
+    """
+    session = ClassSession.objects.get(id=class_session_id)
+    enrolled_prns = enrolled_prns_of([session.subject_id])
+
+    body = merge_attendance.s(class_session_id, enrolled_prns)
+    return _evaluate_photos(self, session, photo_ids, enrolled_prns, scheme, host, body)
+
+
+@shared_task(name=MERGE_ATTENDANCE, acks_late=True, reject_on_worker_lost=True)
+def merge_attendance(photo_results, class_session_id, enrolled_prns):
+    """
+    Chord callback for added photos: mark the newly found students present.
+    Only absent -> present transitions are applied, so present_count grows by
+    exactly the number of students whose status changed, a redelivery
+    changes nothing, and only those students are notified.
+    """
+    session = ClassSession.objects.get(id=class_session_id)
+
+    found_prns = present_prns_of(photo_results)
+
+    absent_ids = AttendanceRecord.objects.filter(
+        class_session=session,
+        student__prn__in=found_prns,
+        status=False,
+    ).values_list('student_id', flat=True)
+    changed_students = [
+        student for student, _ in apply_status_changes(session, {student_id: True for student_id in absent_ids})
+    ]
+    checkpoints.clear(class_session_id, [r["photo_id"] for r in photo_results])
+
+    present_count = AttendanceRecord.objects.filter(class_session=session, status=True).count()
+    return {
+        **summarize_photos(photo_results),
+        "class_session_id": class_session_id,
+        "present_count": present_count,
+        "absent_count": len(enrolled_prns) - present_count,
+        "newly_present": [student.prn for student in changed_students],
+        "subject": session.subject.name,
+    }
+
+
+@shared_task(bind=True, name=EVALUATE_COMBINED, acks_late=True, reject_on_worker_lost=True, **PIPELINE_RETRY)
+def evaluate_combined(self, class_session_ids, scheme, host):
+    """
+    One photo set shared by several sessions in the same hall. The photos
+    (attached to the first session) go through the face pipeline once and
+    are matched against the union of the sessions' enrolled students with a
+    single embedding matrix; finalize_combined then splits the result per
+    session.
+    """
+    sessions = list(ClassSession.objects.filter(id__in=class_session_ids))
+    sessions.sort(key=lambda session: class_session_ids.index(session.id))
+    primary = sessions[0]
+    photo_ids = list(primary.photos.order_by('id').values_list('id', flat=True))
+
+    subject_ids = [session.subject_id for session in sessions]
+    enrolled_prns = enrolled_prns_of(subject_ids)
+
+    body = finalize_combined.s(class_session_ids)
+    return _evaluate_photos(self, primary, photo_ids, enrolled_prns, scheme, host, body, subject_ids)
+
+
+@shared_task(name=FINALIZE_COMBINED, acks_late=True, reject_on_worker_lost=True)
+def finalize_combined(photo_results, class_session_ids):
+    """
+    Chord callback of evaluate_combined: every matched student is marked
+    present in each session whose subject they are enrolled in, and the
+    AttendanceRecords of all sessions are written in one transaction.
+    """
+    present_student_prns = present_prns_of(photo_results)
+
+    sessions = list(ClassSession.objects.filter(id__in=class_session_ids).select_related('subject'))
+    notifications = []
+    per_session = []
+    with transaction.atomic():
+        for session in sessions:
+            enrolled_prns = enrolled_prns_of([session.subject_id])
+            total_sessions = ClassSession.objects.filter(subject=session.subject).count()
+            session_present = present_student_prns.intersection(enrolled_prns)
+
+            written = write_attendance(session, enrolled_prns, session_present, total_sessions, notify=False)
+            if written is not None:
+                notifications.append((session, written))
+            per_session.append({
+                "class_session_id": session.id,
+                "subject": session.subject.name,
+                "present_count": len(session_present),
+                "absent_count": len(enrolled_prns) - len(session_present),
+            })
+
+    for session, student_notification_list in notifications:
+        send_attendance_notifications(
+            student_notification_list,
+            session.subject.name,
+            session.class_datetime
+        )
+    checkpoints.clear(class_session_ids[0], [r["photo_id"] for r in photo_results])
+
+    return {
+        **summarize_photos(photo_results),
+        "sessions": per_session,
+    }
+
+
+@shared_task(bind=True, name=EVALUATE_VIDEO, acks_late=True, reject_on_worker_lost=True)
+def evaluate_video(self, total_sessions, class_session_id, video_name):
+    """
+    Mark a session's attendance from a classroom video instead of photos,
+    see Home/video.py. The video is removed from storage once attendance is
+    written. A video without a single decodable frame fails the task and
+    is kept, instead of marking every student absent.
+    """
+    session = ClassSession.objects.get(id=class_session_id)
+    enrolled_prns = enrolled_prns_of([session.subject_id])
+
+    matcher = pipeline.make_matcher([session.subject_id], enrolled_prns)
+    faces, stats = video.evaluate_video(default_storage.path(video_name), matcher)
+    session_faces.save_faces(session.id, None, faces)
+
+    video_result = {
+        "photo_id": None,
+        "present_prns": [face.match["prn"] for face in faces if face.is_present],
+        "faces": [face.to_result() for face in faces],
+        "image_url": None,
+        "stats": stats,
+    }
+    result = finalize_attendance([video_result], total_sessions, class_session_id, enrolled_prns)
+    result["video"] = stats
+    default_storage.delete(video_name)
+    return result
+
+
+@shared_task(name=FACE_MODEL_STATUS)
+def face_model_status():
+    """
+    Warm-up status and load timings of the face models in the worker
+    process that runs this task.
+    """
+    return registry.status()
+
+
+@shared_task(name=COMPUTE_FACE_EMBEDDING)
+def compute_face_embedding(photo_path):
+    """
+    Facenet512 embedding of a registration photo. Runs on the worker so the
+    web process never has to load the face models.
+    """
+    image = Image.open(photo_path).convert("RGB")
+    try:
+        embedding = DeepFace.represent(
+            img_path=np.array(image),
+            model_name="Facenet512",
+            detector_backend="retinaface",
+            enforce_detection=True,
+        )[0]["embedding"]
+    except ValueError as ve:
+        return {"error": str(ve)}
+    return {"embedding": embedding}
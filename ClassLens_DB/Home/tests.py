@@ -1,3 +1,210 @@
-from django.test import TestCase
+import struct
+from types import SimpleNamespace
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from .matching import UNMATCHED, assign_faces, cosine_distances, match_faces, normalize_rows
+from .stage_runner import Stage, run_stages
+from .tiling import Detection, suppress, tile_origins
+from .vectors import decode_vectors
+
+
+def _unit(*values):
+    return normalize_rows(np.array(values, dtype=np.float32))[0]
+
+
+class AssignFacesTests(SimpleTestCase):
+    def test_assignment_is_one_to_one_and_minimises_total_distance(self):
+        # Both faces are nearest to student 0; greedy nearest-student
+        # matching would give face 0 student 0 and leave face 1 without a
+        # student under the threshold.
+        distances = np.array([
+            [0.10, 0.20],
+            [0.05, 0.60],
+        ])
+        self.assertEqual(assign_faces(distances, threshold=0.5), {0: 1, 1: 0})
+
+    def test_pairs_at_or_above_threshold_are_not_assigned(self):
+        distances = np.array([
+            [0.20, 0.90],
+            [0.80, 0.50],
+        ])
+        self.assertEqual(assign_faces(distances, threshold=0.5), {0: 0})
+
+    def test_more_faces_than_students(self):
+        distances = np.array([[0.30], [0.10], [0.20]])
+        self.assertEqual(assign_faces(distances, threshold=0.5), {1: 0})
+
+    def test_empty(self):
+        self.assertEqual(assign_faces(np.zeros((0, 3)), threshold=0.5), {})
+        self.assertEqual(assign_faces(np.zeros((2, 0)), threshold=0.5), {})
+
+
+class MatchFacesTests(SimpleTestCase):
+    def setUp(self):
+        self.prns = [1001, 1002]
+        self.matrix = np.stack([_unit(1, 0, 0), _unit(0, 1, 0)])
+
+    def test_matches_and_reports_nearest(self):
+        faces = np.array([[0, 2, 0.1], [3, 0, 0]], dtype=np.float32)
+        results = match_faces(faces, self.prns, self.matrix, threshold=0.3)
+
+        self.assertEqual([r["prn"] for r in results], [1002, 1001])
+        self.assertEqual([r["nearest_prn"] for r in results], [1002, 1001])
+        self.assertAlmostEqual(results[1]["distance"], 0.0, places=5)
+
+    def test_face_over_threshold_keeps_its_nearest_student(self):
+        faces = np.array([[1, 1, 1]], dtype=np.float32)
+        [result] = match_faces(faces, self.prns, self.matrix, threshold=0.3)
+
+        self.assertIsNone(result["prn"])
+        self.assertIsNone(result["distance"])
+        self.assertIn(result["nearest_prn"], self.prns)
+        self.assertGreater(result["nearest_distance"], 0.3)
+
+    def test_one_student_is_not_given_to_two_faces(self):
+        faces = np.array([[1, 0.01, 0], [1, 0.02, 0]], dtype=np.float32)
+        results = match_faces(faces, self.prns, self.matrix, threshold=0.3)
+        self.assertEqual(sorted(r["prn"] for r in results if r["prn"]), [1001])
+
+    def test_no_enrolled_students(self):
+        faces = np.array([[1, 0, 0]], dtype=np.float32)
+        results = match_faces(faces, [], np.zeros((0, 3), dtype=np.float32), threshold=0.3)
+        self.assertEqual(results, [UNMATCHED])
+
+    def test_cosine_distances_ignore_magnitude(self):
+        distances = cosine_distances(np.array([[10, 0, 0]], dtype=np.float32), self.matrix)
+        np.testing.assert_allclose(distances, [[0.0, 1.0]], atol=1e-6)
+
+    def test_normalize_rows_leaves_zero_rows_alone(self):
+        np.testing.assert_array_equal(normalize_rows([[0, 0, 0]]), [[0, 0, 0]])
+
+
+def _vector_send(values):
+    # pgvector's binary send format: uint16 dimensions, uint16 reserved,
+    # then big-endian float4 values.
+    return struct.pack(">HH", len(values), 0) + struct.pack(f">{len(values)}f", *values)
+
+
+class DecodeVectorsTests(SimpleTestCase):
+    def test_decodes_payloads_into_rows(self):
+        vectors = [[0.5, -1.25, 3.0], [1e-3, 0.0, -7.5]]
+        matrix = decode_vectors([_vector_send(v) for v in vectors], dimensions=3)
+
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertEqual(matrix.shape, (2, 3))
+        np.testing.assert_array_equal(matrix, np.array(vectors, dtype=np.float32))
+
+    def test_memoryview_payloads(self):
+        # psycopg2 returns bytea columns as memoryview.
+        matrix = decode_vectors([memoryview(_vector_send([1.0, 2.0]))], dimensions=2)
+        np.testing.assert_array_equal(matrix, [[1.0, 2.0]])
+
+    def test_no_payloads(self):
+        self.assertEqual(decode_vectors([], dimensions=512).shape, (0, 512))
+
+    def test_wrong_dimension_fails(self):
+        with self.assertRaises(ValueError):
+            decode_vectors([_vector_send([1.0, 2.0, 3.0])], dimensions=2)
+
+
+class TilingTests(SimpleTestCase):
+    def test_tile_origins_cover_length_with_overlap(self):
+        origins = tile_origins(3000, 1280, 256)
+        self.assertEqual(origins[0], 0)
+        self.assertEqual(origins[-1], 3000 - 1280)
+        for a, b in zip(origins, origins[1:]):
+            self.assertLessEqual(b - a, 1280 - 256)
+
+    def test_single_tile_when_it_fits(self):
+        self.assertEqual(tile_origins(800, 1280, 256), [0])
+
+    def test_suppress_prefers_whole_faces_and_drops_contained_parts(self):
+        whole = Detection(x=100, y=100, w=80, h=80, confidence=0.9)
+        cut = Detection(x=100, y=100, w=40, h=80, confidence=0.99, on_tile_edge=True)
+        other = Detection(x=400, y=100, w=80, h=80, confidence=0.8)
+
+        kept = suppress([cut, whole, other], iou_threshold=0.4, containment_threshold=0.6)
+        self.assertEqual(kept, [whole, other])
+
+
+class StageRunnerTests(SimpleTestCase):
+    def test_runs_every_item_through_every_stage(self):
+        stages = [Stage("double", lambda x: x * 2, workers=2), Stage("inc", lambda x: x + 1, workers=3)]
+        outputs, stats = run_stages(range(20), stages)
+
+        self.assertEqual(sorted(outputs), [x * 2 + 1 for x in range(20)])
+        self.assertEqual(stats["inc"]["workers"], 3)
+        self.assertEqual(stats["double"]["errors"], 0)
+
+    def test_failing_items_are_counted_and_dropped(self):
+        def fail_on_odd(x):
+            if x % 2:
+                raise ValueError(x)
+            return x
+
+        outputs, stats = run_stages(range(10), [Stage("check", fail_on_odd, workers=2), Stage("id", lambda x: x)])
+
+        self.assertEqual(sorted(outputs), [0, 2, 4, 6, 8])
+        self.assertEqual(stats["check"]["errors"], 5)
+        self.assertEqual(stats["id"]["errors"], 0)
+
+
+class ChooseReductionTests(SimpleTestCase):
+    @override_settings(DETECTION_MODE='reduced', DETECTION_SMALLEST_FACE_FRACTION=0.012, DETECTION_MIN_FACE_PX=24)
+    def test_largest_reduction_that_keeps_the_smallest_face(self):
+        from .pipeline import choose_reduction
+
+        # Smallest face 48 px: 1/2 leaves 24 px, 1/4 would leave 12.
+        self.assertEqual(choose_reduction(4000, 3000), 2)
+        # Smallest face 96 px: 1/4 leaves 24 px.
+        self.assertEqual(choose_reduction(8000, 6000), 4)
+        self.assertEqual(choose_reduction(1600, 1200), 1)
+
+    @override_settings(DETECTION_MODE='full')
+    def test_no_reduction_outside_reduced_mode(self):
+        from .pipeline import choose_reduction
+
+        self.assertEqual(choose_reduction(8000, 6000), 1)
+
+
+def _face(x, y, size=50):
+    return SimpleNamespace(
+        facial_area={"x": x, "y": y, "w": size, "h": size},
+        decision="keep",
+        quality={"size": size, "sharpness": 100.0},
+    )
+
+
+@override_settings(VIDEO_TRACK_IOU=0.3, VIDEO_TRACK_MAX_MISSES=2)
+class IoUTrackerTests(SimpleTestCase):
+    def test_camera_shift_keeps_a_panning_face_on_one_track(self):
+        from .video import IoUTracker
+
+        tracker = IoUTracker()
+        for index in range(5):
+            # The camera pans so the face moves 60 px left per sample, more
+            # than its own width.
+            tracker.update([_face(500 - 60 * index, 200)], index, shift=(-60.0, 0.0) if index else (0.0, 0.0))
+
+        [track] = tracker.tracks()
+        self.assertEqual(track.length, 5)
+
+    def test_without_shift_a_fast_pan_splits_tracks(self):
+        from .video import IoUTracker
+
+        tracker = IoUTracker()
+        for index in range(3):
+            tracker.update([_face(500 - 60 * index, 200)], index)
+        self.assertEqual(len(tracker.tracks()), 3)
+
+    def test_unseen_tracks_are_closed(self):
+        from .video import IoUTracker
+
+        tracker = IoUTracker()
+        tracker.update([_face(100, 100)], 0)
+        for index in range(1, 5):
+            tracker.update([], index)
+        self.assertEqual(len(tracker.live), 0)
+        self.assertEqual(len(tracker.closed), 1)
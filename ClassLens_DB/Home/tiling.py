@@ -0,0 +1,129 @@
+"""
+Tiled face detection for very high-resolution photos.
+
+The photo is split into overlapping tiles, RetinaFace runs on the tiles
+concurrently in a thread pool, and the per-tile detections are shifted back
+to photo coordinates and merged with cross-tile non-maximum suppression.
+The overlap should be at least the size of the largest face expected, so
+every face lies whole inside at least one tile.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+# Landmark attributes of deepface's FacialAreaRegion.
+_LANDMARKS = ("left_eye", "right_eye", "nose", "mouth_left", "mouth_right")
+
+
+@dataclass
+class Detection:
+    x: int
+    y: int
+    w: int
+    h: int
+    confidence: Optional[float] = None
+    left_eye: Optional[tuple] = None
+    right_eye: Optional[tuple] = None
+    nose: Optional[tuple] = None
+    mouth_left: Optional[tuple] = None
+    mouth_right: Optional[tuple] = None
+    # True when the box touches an edge of its tile that is inside the photo,
+    # i.e. the face may have been cut by the tiling.
+    on_tile_edge: bool = False
+
+
+def tile_origins(length, tile, overlap):
+    """
+    Start offsets of tiles of size `tile` covering [0, length) with at least
+    `overlap` pixels shared between neighbours.
+    """
+    if length <= tile:
+        return [0]
+    step = max(tile - overlap, 1)
+    origins = list(range(0, length - tile, step))
+    origins.append(length - tile)
+    return origins
+
+
+def _shift(point, dx, dy):
+    if point is None:
+        return None
+    return (int(point[0]) + dx, int(point[1]) + dy)
+
+
+def _detect_tile(detector, image, x0, y0, tile):
+    img_h, img_w = image.shape[:2]
+    tile_img = image[y0:y0 + tile, x0:x0 + tile]
+    tile_h, tile_w = tile_img.shape[:2]
+
+    detections = []
+    for region in detector.detect_faces(tile_img):
+        x, y, w, h = int(region.x), int(region.y), int(region.w), int(region.h)
+        on_tile_edge = (
+            (x <= 1 and x0 > 0)
+            or (y <= 1 and y0 > 0)
+            or (x + w >= tile_w - 1 and x0 + tile_w < img_w)
+            or (y + h >= tile_h - 1 and y0 + tile_h < img_h)
+        )
+        detections.append(Detection(
+            x=x + x0,
+            y=y + y0,
+            w=w,
+            h=h,
+            confidence=getattr(region, 'confidence', None),
+            on_tile_edge=on_tile_edge,
+            **{name: _shift(getattr(region, name, None), x0, y0) for name in _LANDMARKS},
+        ))
+    return detections
+
+
+def _overlap(a, b):
+    ix = max(0, min(a.x + a.w, b.x + b.w) - max(a.x, b.x))
+    iy = max(0, min(a.y + a.h, b.y + b.h) - max(a.y, b.y))
+    intersection = ix * iy
+    if intersection == 0:
+        return 0.0, 0.0
+    area_a, area_b = a.w * a.h, b.w * b.h
+    iou = intersection / float(area_a + area_b - intersection)
+    containment = intersection / float(min(area_a, area_b))
+    return iou, containment
+
+
+def suppress(detections, iou_threshold, containment_threshold):
+    """
+    Cross-tile non-maximum suppression. Faces seen whole are preferred over
+    faces cut by a tile edge, then higher confidence and larger boxes win.
+    A box is dropped when it overlaps a kept box by more than iou_threshold,
+    or when more than containment_threshold of it lies inside a kept box
+    (the partial face a neighbouring tile saw).
+    """
+    ranked = sorted(
+        detections,
+        key=lambda d: (not d.on_tile_edge, d.confidence or 0.0, d.w * d.h),
+        reverse=True,
+    )
+    kept = []
+    for candidate in ranked:
+        if all(
+            iou <= iou_threshold and containment <= containment_threshold
+            for iou, containment in (_overlap(candidate, other) for other in kept)
+        ):
+            kept.append(candidate)
+    return kept
+
+
+def detect_tiled(detector, image, tile, overlap, workers, iou_threshold=0.4, containment_threshold=0.6):
+    """
+    Detect faces on overlapping tiles of `image` in a pool of `workers`
+    threads. Returns (detections, tile_count).
+    """
+    img_h, img_w = image.shape[:2]
+    origins = [
+        (x0, y0)
+        for y0 in tile_origins(img_h, tile, overlap)
+        for x0 in tile_origins(img_w, tile, overlap)
+    ]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        per_tile = pool.map(lambda origin: _detect_tile(detector, image, origin[0], origin[1], tile), origins)
+        detections = [detection for tile_detections in per_tile for detection in tile_detections]
+    return suppress(detections, iou_threshold, containment_threshold), len(origins)
@@ -1,7 +1,7 @@
 from django.urls import path
 from django.urls import include
 
-from Home.views import getDepartments,registerNewStudent,mark_attendance,teacher_profile,registerNewTeacher,validateStudent,validateTeacher,send_otp,verify_otp,set_password,get_subject_details,verify_email, verify_prn, get_student_attendance,attendance_status,teacher_subjects, get_present_absent_list,change_attendance,get_student_dashboard,update_notification_token,remove_notification_token
+from Home.views import getDepartments,registerNewStudent,mark_attendance,teacher_profile,registerNewTeacher,validateStudent,validateTeacher,send_otp,verify_otp,set_password,get_subject_details,verify_email, verify_prn, get_student_attendance,attendance_status,teacher_subjects, get_present_absent_list,change_attendance,get_student_dashboard,update_notification_token,remove_notification_token,add_attendance_photos,mark_attendance_video,rematch_session,face_suggestions,confirm_face_suggestion,mark_combined_attendance,annotated_photo
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -19,10 +19,17 @@ urlpatterns = [
     path("students/attendance/", get_student_attendance, name="get_student_attendance"),
     path('verifyPRN',verify_prn, name='verify_prn'),
     path('markAttendance',mark_attendance, name='mark_attendance'),
+    path('markCombinedAttendance',mark_combined_attendance, name='mark_combined_attendance'),
+    path('markAttendanceVideo',mark_attendance_video, name='mark_attendance_video'),
+    path('addAttendancePhotos',add_attendance_photos, name='add_attendance_photos'),
     path('attendanceStatus/<str:task_id>/',attendance_status, name='attendance_status'),
     path('getSubjects/',teacher_subjects, name='get_teacher_subjects'),
     path('getPresentAbsentList/',get_present_absent_list, name='get_present_absent_list'),
     path('changeAttendance/',change_attendance, name='change_attendance'),
+    path('rematchSession/',rematch_session, name='rematch_session'),
+    path('faceSuggestions/<int:class_session_id>/',face_suggestions, name='face_suggestions'),
+    path('confirmFaceSuggestion/',confirm_face_suggestion, name='confirm_face_suggestion'),
+    path('annotatedPhoto/<int:photo_id>/',annotated_photo, name='annotated_photo'),
     path('teacherProfile/<int:teacher_id>/',teacher_profile, name='teacher_profile'),
     path('student/dashboard/', get_student_dashboard, name='get_student_dashboard'),
     path('student/notification-token/', update_notification_token, name='update_notification_token'),
@@ -0,0 +1,53 @@
+"""
+Binary reads of pgvector columns.
+
+psycopg2 talks to Postgres in text mode, so a plain read of a vector column
+formats every float on the server and pgvector's VectorField parses it back
+one float at a time in Python. Selecting vector_send(column) instead returns
+the binary send format as bytea: a big-endian uint16 dimension count, a
+uint16 reserved word, then the float4 values. Those bytes are turned into
+float32 arrays with np.frombuffer, without any Python-level parsing.
+"""
+import numpy as np
+from django.db.models import BinaryField, F, Func
+
+class VectorSend(Func):
+    function = 'vector_send'
+    output_field = BinaryField()
+
+
+def annotate_embedding_bytes(queryset, field='face_embedding', alias='embedding_bytes'):
+    """
+    Annotate `queryset` with the binary form of a vector column.
+    """
+    return queryset.annotate(**{alias: VectorSend(F(field))})
+
+
+def decode_vectors(values, dimensions):
+    """
+    Decode many vector_send payloads of the same dimension into one
+    (len(values), dimensions) float32 matrix with a single frombuffer call.
+    """
+    if not values:
+        return np.zeros((0, dimensions), dtype=np.float32)
+    # The 4-byte dimension/reserved header is exactly one float4 slot, so
+    # every payload is one row of dimensions + 1 columns.
+    raw = np.frombuffer(b''.join(values), dtype='>f4').reshape(len(values), dimensions + 1)
+    return raw[:, 1:].astype(np.float32)
+
+
+def load_student_embeddings(queryset, dimensions=512):
+    """
+    Return (prns, matrix) for the students of `queryset` that have a face
+    embedding, reading the vectors in binary.
+    """
+    rows = annotate_embedding_bytes(
+        queryset.filter(face_embedding__isnull=False)
+    ).values_list('prn', 'embedding_bytes')
+
+    prns = []
+    payloads = []
+    for prn, payload in rows:
+        prns.append(prn)
+        payloads.append(payload)
+    return prns, decode_vectors(payloads, dimensions)
@@ -0,0 +1,225 @@
+"""
+Attendance from a video panned across the classroom.
+
+Frames are sampled at settings.VIDEO_SAMPLE_FPS (the frames in between are
+only grabbed, not decoded) and every sampled frame goes through the photo
+pipeline's detect and align stages. An IoU tracker links the faces of
+consecutive sampled frames into tracks and each track keeps only its best
+crop, the largest and sharpest one. Restoration, Facenet and matching then
+run once per track, so inference after detection scales with the number of
+people in the room rather than the number of frames.
+
+A pan moves every face further between two samples than its own width, so
+the camera's global shift is estimated first (phase correlation on small
+grey frames) and the live track boxes are moved by it before the IoU
+assignment.
+"""
+import math
+
+import cv2
+import numpy as np
+from django.conf import settings
+from scipy.optimize import linear_sum_assignment
+
+from . import pipeline
+from .face_quality import SKIP
+
+# Width the frames are reduced to for the global shift estimate.
+_MOTION_WIDTH = 320
+
+# Below this phase correlation peak the frames do not line up (scene cut,
+# motion blur) and no shift is applied.
+_MIN_MOTION_RESPONSE = 0.05
+
+
+class UnreadableVideo(Exception):
+    """
+    Not a single frame of the video could be decoded (unsupported codec,
+    truncated upload).
+    """
+
+
+def _iou(a, b):
+    ix = max(0, min(a["x"] + a["w"], b["x"] + b["w"]) - max(a["x"], b["x"]))
+    iy = max(0, min(a["y"] + a["h"], b["y"] + b["h"]) - max(a["y"], b["y"]))
+    intersection = ix * iy
+    if intersection == 0:
+        return 0.0
+    return intersection / float(a["w"] * a["h"] + b["w"] * b["h"] - intersection)
+
+
+def crop_score(face):
+    """
+    How good a crop of a track is: larger and sharper is better. Sharpness
+    (Laplacian variance) is log-scaled so a slightly sharper but much
+    smaller crop does not win.
+    """
+    if face.decision == SKIP or not face.quality:
+        return -1.0
+    return face.quality["size"] * math.log1p(face.quality["sharpness"])
+
+
+class Track:
+    def __init__(self, track_id, face, frame_index):
+        self.track_id = track_id
+        self.box = face.facial_area
+        self.last_frame = frame_index
+        self.length = 1
+        self.best = face
+        self.best_score = crop_score(face)
+
+    def shift(self, dx, dy):
+        # A new dict: the box is the face's own facial_area.
+        self.box = dict(self.box, x=self.box["x"] + dx, y=self.box["y"] + dy)
+
+    def add(self, face, frame_index):
+        self.box = face.facial_area
+        self.last_frame = frame_index
+        self.length += 1
+        score = crop_score(face)
+        if score > self.best_score:
+            self.best, self.best_score = face, score
+
+
+class IoUTracker:
+    """
+    Links the faces of each sampled frame to the live tracks by a one-to-one
+    assignment on box IoU. Tracks not seen for more than
+    settings.VIDEO_TRACK_MAX_MISSES sampled frames are closed.
+    """
+
+    def __init__(self, min_iou=None, max_misses=None):
+        self.min_iou = settings.VIDEO_TRACK_IOU if min_iou is None else min_iou
+        self.max_misses = settings.VIDEO_TRACK_MAX_MISSES if max_misses is None else max_misses
+        self.live = []
+        self.closed = []
+        self._next_id = 0
+
+    def update(self, faces, frame_index, shift=(0.0, 0.0)):
+        """
+        Link `faces` of a sampled frame to the tracks, after moving the live
+        tracks by the camera `shift` (dx, dy) since the previous sample.
+        """
+        dx, dy = shift
+        if dx or dy:
+            for track in self.live:
+                track.shift(dx, dy)
+
+        matched_faces = set()
+        if self.live and faces:
+            iou = np.array([[_iou(track.box, face.facial_area) for face in faces] for track in self.live])
+            rows, cols = linear_sum_assignment(-iou)
+            for row, col in zip(rows, cols):
+                if iou[row, col] >= self.min_iou:
+                    self.live[row].add(faces[col], frame_index)
+                    matched_faces.add(col)
+
+        for index, face in enumerate(faces):
+            if index not in matched_faces:
+                self.live.append(Track(self._next_id, face, frame_index))
+                self._next_id += 1
+
+        still_live = []
+        for track in self.live:
+            if frame_index - track.last_frame > self.max_misses:
+                self.closed.append(track)
+            else:
+                still_live.append(track)
+        self.live = still_live
+
+    def tracks(self):
+        return self.closed + self.live
+
+
+def sample_frames(path, stats=None):
+    """
+    Yield (index, frame) for the sampled frames of a video, at most
+    settings.VIDEO_MAX_FRAMES of them. Skipped frames are grabbed but not
+    decoded. When the video goes on past the limit, stats["truncated"] is
+    set.
+    """
+    capture = cv2.VideoCapture(path)
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, int(round(fps / settings.VIDEO_SAMPLE_FPS)))
+        frame_number = 0
+        sampled = 0
+        while sampled < settings.VIDEO_MAX_FRAMES:
+            if not capture.grab():
+                break
+            if frame_number % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    yield sampled, frame
+                    sampled += 1
+            frame_number += 1
+        else:
+            if stats is not None:
+                stats["truncated"] = capture.grab()
+    finally:
+        capture.release()
+
+
+class CameraMotion:
+    """
+    Global shift of the picture between consecutive sampled frames.
+    """
+
+    def __init__(self):
+        self.previous = None
+        self.window = None
+
+    def shift(self, frame):
+        grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        scale = min(1.0, _MOTION_WIDTH / float(grey.shape[1]))
+        if scale < 1.0:
+            grey = cv2.resize(grey, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        current = np.float32(grey)
+
+        previous, self.previous = self.previous, current
+        if previous is None or previous.shape != current.shape:
+            return 0.0, 0.0
+        if self.window is None or self.window.shape != current.shape:
+            self.window = cv2.createHanningWindow((current.shape[1], current.shape[0]), cv2.CV_32F)
+        (dx, dy), response = cv2.phaseCorrelate(previous, current, self.window)
+        if response < _MIN_MOTION_RESPONSE:
+            return 0.0, 0.0
+        return dx / scale, dy / scale
+
+
+def evaluate_video(path, matcher):
+    """
+    Detect, track, embed and match the faces of a video. Returns the matched
+    track faces and the stats of the run; stats["truncated"] tells that the
+    video was longer than settings.VIDEO_MAX_FRAMES samples. Raises
+    UnreadableVideo when no frame could be decoded.
+    """
+    tracker = IoUTracker()
+    motion = CameraMotion()
+    stats = {"frames_decoded": 0, "detector_invocations": 0, "tracks": 0, "embeddings": 0, "truncated": False}
+
+    for index, frame in sample_frames(path, stats):
+        stats["frames_decoded"] += 1
+        shift = motion.shift(frame)
+        photo = pipeline.PhotoRecord(photo_id=None, image=frame, full_image=frame)
+        faces = pipeline.align(photo, pipeline.detect(photo))
+        stats["detector_invocations"] += photo.detector_invocations
+        tracker.update(faces, index, shift)
+
+    if stats["frames_decoded"] == 0:
+        raise UnreadableVideo(f"No frame of {path} could be decoded.")
+
+    # A student seen in a single sample is kept as long as that crop passed
+    # the quality gate; only tracks with no usable crop are dropped.
+    tracks = tracker.tracks()
+    stats["tracks"] = len(tracks)
+
+    faces = [track.best for track in tracks if track.best.decision != SKIP]
+    pipeline.restore(faces)
+    pipeline.embed(faces)
+
+    embedded = [face for face in faces if face.embedding is not None]
+    stats["embeddings"] = len(embedded)
+    for face, result in zip(embedded, matcher([face.embedding for face in embedded])):
+        face.match = result
+    return faces, stats
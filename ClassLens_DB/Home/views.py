@@ -1,18 +1,18 @@
 from rest_framework import status
 import string
+from django.db import transaction
 from django.db.models import F
 from rest_framework.decorators import api_view, parser_classes,permission_classes
-from deepface import DeepFace
-from PIL import Image
 import numpy as np
 from rest_framework.response import Response
-from .models import Department, Student, Teacher, SubjectFromDept, StudentAttendancePercentage,AttendanceRecord, StudentEnrollment,TeacherSubject, ClassSession, Subject,AttendancePhotos,AdminUser
+from .models import Department, Student, Teacher, SubjectFromDept, StudentAttendancePercentage,AttendanceRecord, StudentEnrollment,TeacherSubject, ClassSession, Subject,AttendancePhotos,AdminUser,SessionFace
 from django.db.models import Count, Q
 from .serializers import DepartmentSerializer,SubjectSerializer
 from rest_framework.parsers import MultiPartParser
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.hashers import make_password, check_password
 from django.shortcuts import get_object_or_404
+from django.http import FileResponse
 import traceback
 import random
 from datetime import datetime
@@ -22,11 +22,12 @@ from django.conf import settings
 import environ
 import os
 from pathlib import Path
-import cv2
-import matplotlib.pyplot as plt
 import uuid
-from .tasks import evaluate_attendance, send_attendance_notifications
+from . import annotations, session_faces, task_signatures
+from .attendance import apply_status_changes
+from .progress import get_progress
 from django.core.files.storage import default_storage
+from celery.exceptions import TimeoutError as CeleryTimeoutError
 from celery.result import AsyncResult
 from pgvector.django import CosineDistance
 from rest_framework.permissions import AllowAny, IsAuthenticated
@@ -393,6 +394,8 @@ def set_password(request, *args, **kwargs):
                     student.face_embedding=registerNewStudent(request.FILES.get("photo"))
                 except ValueError as ve :
                     return Response({"error": "Face Not Detected, Upload A New Image"}, status=status.HTTP_400_BAD_REQUEST)
+                except CeleryTimeoutError:
+                    return Response({"error": "Face processing is busy, please try again shortly."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
                 student.save()
                 print("Student password set successfully")
                 return Response({"message": "Student password set successfully"}, status=200)
@@ -413,20 +416,17 @@ def registerNewStudent(photo):
             {"error": "No photo uploaded"}, status=status.HTTP_400_BAD_REQUEST
         )
 
+    photo_path = default_storage.save(f"registration_photos/{uuid.uuid4()}_{photo.name}", photo)
     try:
-        image = Image.open(photo)
-        image = image.convert("RGB")
-        img_arr = np.array(image)
-        image_embedding = DeepFace.represent(
-            img_path=img_arr,
-            model_name="Facenet512",
-            detector_backend="retinaface",
-            enforce_detection=True,
-        )[0]["embedding"]
-
-        return image_embedding
-    except ValueError as ve:
-        return ValueError(ve)
+        result = task_signatures.compute_face_embedding(
+            default_storage.path(photo_path)
+        ).get(timeout=settings.FACE_EMBEDDING_TIMEOUT)
+    finally:
+        default_storage.delete(photo_path)
+
+    if "error" in result:
+        raise ValueError(result["error"])
+    return np.asarray(result["embedding"], dtype=np.float32)
 
 @api_view(["POST"])
 def get_student_attendance(request, *args, **kwargs):
@@ -502,7 +502,7 @@ def mark_attendance(request, *args, **kwargs):
                 photo=photo
             )
 
-        task = evaluate_attendance.delay(total_sessions,class_session.id,request.scheme, request.get_host())
+        task = task_signatures.evaluate_attendance(total_sessions,class_session.id,request.scheme, request.get_host())
 
         return Response({
             "message": "Attendance processing started. You will be notified once it's done.",
@@ -523,6 +523,147 @@ def mark_attendance(request, *args, **kwargs):
     #     "task_id": task.id
     # }, status=202)
 
+@api_view(["POST"])
+@parser_classes([MultiPartParser])
+def mark_attendance_video(request, *args, **kwargs):
+    """
+    API endpoint to start an attendance session from a classroom video.
+    Expects form-data with: video, subjectID, teacherID, departmentName, year
+    """
+    video = request.FILES.get("video")
+    subject_id = request.data.get("subjectID")
+    teacher_id = request.data.get("teacherID")
+    departmentName = request.data.get("departmentName")
+    year = request.data.get("year")
+
+    if not all([video, subject_id, teacher_id, departmentName, year]):
+        return Response({"error": "Missing required fields (video, subject_id, teacher_id, department_id, year)."}, status=400)
+
+    try:
+        class_session = ClassSession.objects.create(
+            department = get_object_or_404(Department, name=departmentName),
+            year = year,
+            subject = get_object_or_404(Subject, id=subject_id),
+            teacher = get_object_or_404(Teacher, id=teacher_id),
+            class_datetime = datetime.now(),
+        )
+
+        total_sessions=ClassSession.objects.filter(
+            subject=class_session.subject
+        ).count()
+
+        video_name = default_storage.save(f"attendance_videos/{uuid.uuid4()}_{video.name}", video)
+
+        task = task_signatures.evaluate_video(total_sessions, class_session.id, video_name)
+
+        return Response({
+            "message": "Attendance processing started. You will be notified once it's done.",
+            "task_id": task.id
+        }, status=202)
+
+    except Exception as e:
+        traceback.print_exc()
+        return Response({"error": "Failed to start attendance session."}, status=500)
+
+@api_view(["POST"])
+@parser_classes([MultiPartParser])
+def mark_combined_attendance(request, *args, **kwargs):
+    """
+    API endpoint to mark several sessions held in the same hall from one
+    photo set. A session is created for every subject, the photos are
+    processed once and every recognised student is marked in the session of
+    the subject they are enrolled in.
+    Expects form-data with: photo, subjectIDs (repeated), teacherID, departmentName, year
+    """
+    photos = request.FILES.getlist("photo")
+    subject_ids = request.data.getlist("subjectIDs")
+    teacher_id = request.data.get("teacherID")
+    departmentName = request.data.get("departmentName")
+    year = request.data.get("year")
+
+    if not all([photos, subject_ids, teacher_id, departmentName, year]):
+        return Response({"error": "Missing required fields (photo, subjectIDs, teacherID, departmentName, year)."}, status=400)
+
+    try:
+        subject_ids = list(dict.fromkeys(int(subject_id) for subject_id in subject_ids))
+    except ValueError:
+        return Response({"error": "subjectIDs must be integers."}, status=400)
+
+    subjects = {subject.id: subject for subject in Subject.objects.filter(id__in=subject_ids)}
+    if len(subjects) != len(subject_ids):
+        return Response({"error": "Subject not found."}, status=404)
+    department = get_object_or_404(Department, name=departmentName)
+    teacher = get_object_or_404(Teacher, id=teacher_id)
+
+    try:
+        class_datetime = datetime.now()
+        with transaction.atomic():
+            class_session_ids = [
+                ClassSession.objects.create(
+                    department=department,
+                    year=year,
+                    subject=subjects[subject_id],
+                    teacher=teacher,
+                    class_datetime=class_datetime,
+                ).id
+                for subject_id in subject_ids
+            ]
+
+            # The shared photos are stored once, with the first session.
+            for photo in photos:
+                AttendancePhotos.objects.create(
+                    class_session_id=class_session_ids[0],
+                    photo=photo
+                )
+
+        task = task_signatures.evaluate_combined(class_session_ids, request.scheme, request.get_host())
+
+        return Response({
+            "message": "Attendance processing started. You will be notified once it's done.",
+            "task_id": task.id,
+            "class_session_ids": class_session_ids,
+        }, status=202)
+
+    except Exception as e:
+        traceback.print_exc()
+        return Response({"error": "Failed to start combined attendance."}, status=500)
+
+@api_view(["POST"])
+@parser_classes([MultiPartParser])
+def add_attendance_photos(request, *args, **kwargs):
+    """
+    API endpoint to add catch-up photos to a session whose attendance is
+    already marked. Only the new photos are processed; students found in
+    them are moved from absent to present.
+    Expects form-data with: photo, class_session_id
+    """
+    photos = request.FILES.getlist("photo")
+    class_session_id = request.data.get("class_session_id")
+
+    if not all([photos, class_session_id]):
+        return Response({"error": "Missing required fields (photo, class_session_id)."}, status=400)
+
+    class_session = get_object_or_404(ClassSession, id=class_session_id)
+    if not AttendanceRecord.objects.filter(class_session=class_session).exists():
+        return Response({"error": "Attendance for this session is still being processed."}, status=409)
+
+    try:
+        photo_ids = [
+            AttendancePhotos.objects.create(class_session=class_session, photo=photo).id
+            for photo in photos
+        ]
+
+        task = task_signatures.evaluate_added_photos(class_session.id, photo_ids, request.scheme, request.get_host())
+
+        return Response({
+            "message": "Additional photos are being processed. Newly found students will be notified.",
+            "task_id": task.id
+        }, status=202)
+
+    except Exception as e:
+        traceback.print_exc()
+        return Response({"error": "Failed to add photos to the session."}, status=500)
+
 @api_view(["POST"])
 def teacher_subjects(request,*args, **kwargs):
     teacher_id = request.data.get("teacher_id")
@@ -576,36 +717,114 @@ def change_attendance(request, *args, **kwargs):
         subject=class_session.subject
     ).count()
 
-    notification_list = []
+    current = AttendanceRecord.objects.filter(
+        class_session_id=class_session_id,
+        student_id__in=student_list
+    ).values_list('student_id', 'status')
+
+    # Toggle every listed student; apply_status_changes moves present_count
+    # and notifies the students whose attendance was changed.
+    apply_status_changes(
+        class_session,
+        {student_id: not current_status for student_id, current_status in current},
+        total_sessions,
+        manual=True
+    )
+    
+    return Response(status=status.HTTP_200_OK)
 
-    for student_id in student_list:
-        attendance_record = AttendanceRecord.objects.filter(class_session_id=class_session_id, student_id=student_id).first()
-        if attendance_record:
-            attendance_record.status = not attendance_record.status
-            StudentAttendancePercentage.objects.filter(
-                student=attendance_record.student,
-                subject=attendance_record.class_session.subject
-            ).update(present_count=F('present_count') + (1 if attendance_record.status else -1))
+@api_view(["POST"])
+def rematch_session(request, *args, **kwargs):
+    """
+    Re-match a session's stored faces against the current enrollment,
+    optionally with another threshold, without running any face model.
+    With "apply" the session's attendance is updated to the new matches.
+    """
+    class_session_id = request.data.get("class_session_id")
+    threshold = request.data.get("threshold")
+    apply = str(request.data.get("apply", "false")).lower() in ("1", "true", "yes")
 
-            StudentAttendancePercentage.objects.filter(
-                student=attendance_record.student,
-                subject=attendance_record.class_session.subject
-            ).update(attendancePercentage=(F('present_count')*100.0)/total_sessions)
+    if not class_session_id:
+        return Response({"error": "class_session_id is required"}, status=400)
 
-            attendance_record.save()
-            
-            # Add to notification list
-            notification_list.append((attendance_record.student, attendance_record.status))
-    
-    # Send notifications to students whose attendance was changed
-    if notification_list:
-        send_attendance_notifications(
-            notification_list,
-            class_session.subject.name,
-            class_session.class_datetime
-        )
-    
-    return Response(status=status.HTTP_200_OK)
+    try:
+        threshold = float(threshold) if threshold is not None else None
+    except ValueError:
+        return Response({"error": "threshold must be a number"}, status=400)
+
+    class_session = get_object_or_404(ClassSession, id=class_session_id)
+    try:
+        result = session_faces.timed_rematch(class_session, threshold=threshold, apply=apply)
+    except session_faces.NoStoredFaces as e:
+        return Response({"error": str(e)}, status=400)
+    except Exception as e:
+        traceback.print_exc()
+        return Response({"error": "Failed to re-match the session."}, status=500)
+    return Response(result, status=status.HTTP_200_OK)
+
+@api_view(["GET"])
+def face_suggestions(request, class_session_id, *args, **kwargs):
+    """
+    Top-k nearest enrolled students for every unmatched or low-confidence
+    face of a session, from the stored face embeddings.
+    """
+    class_session = get_object_or_404(ClassSession, id=class_session_id)
+    try:
+        top_k = int(request.query_params.get("top_k", settings.ATTENDANCE_SUGGEST_TOP_K))
+    except ValueError:
+        return Response({"error": "top_k must be an integer"}, status=400)
+
+    try:
+        suggestions = session_faces.suggest_students(class_session, top_k=top_k)
+    except Exception as e:
+        traceback.print_exc()
+        return Response({"error": "Failed to compute suggestions."}, status=500)
+    return Response({"class_session_id": class_session.id, "faces": suggestions}, status=status.HTTP_200_OK)
+
+@api_view(["POST"])
+def confirm_face_suggestion(request, *args, **kwargs):
+    """
+    One-click confirm of a suggested student for a face: marks the student
+    present (and the face's previous student absent) through the same
+    status update path as changeAttendance.
+    """
+    class_session_id = request.data.get("class_session_id")
+    face_id = request.data.get("face_id")
+    student_id = request.data.get("student_id")
+
+    if not all([class_session_id, face_id, student_id]):
+        return Response({"error": "class_session_id, face_id and student_id are required"}, status=400)
+
+    class_session = get_object_or_404(ClassSession, id=class_session_id)
+    try:
+        changes = session_faces.confirm_suggestion(class_session, face_id, student_id)
+    except (SessionFace.DoesNotExist, Student.DoesNotExist):
+        return Response({"error": "Face or student not found"}, status=404)
+    except session_faces.NotEnrolled as e:
+        return Response({"error": str(e)}, status=400)
+    return Response({"changed": [{"prn": student.prn, "status": is_present} for student, is_present in changes]}, status=status.HTTP_200_OK)
+
+@api_view(["GET"])
+def annotated_photo(request, photo_id, *args, **kwargs):
+    """
+    An attendance photo with its face boxes drawn (green matched, red not),
+    rendered from the stored faces on first request at ?max_width= and
+    served from the cache afterwards.
+    """
+    photo = get_object_or_404(AttendancePhotos, id=photo_id)
+    try:
+        max_width = annotations.snap_width(request.query_params.get("max_width"))
+    except ValueError:
+        return Response({"error": "max_width must be an integer"}, status=400)
+
+    try:
+        rendered = open(annotations.annotated_path(photo, max_width), "rb")
+    except FileNotFoundError:
+        return Response({"error": "Photo file not found"}, status=404)
+    except Exception as e:
+        traceback.print_exc()
+        return Response({"error": "Failed to render the annotated photo."}, status=500)
+    return FileResponse(rendered, content_type="image/jpeg")
 
 @api_view(["GET"])
 def attendance_status(request, task_id,*args, **kwargs):
@@ -616,10 +835,14 @@ def attendance_status(request, task_id,*args, **kwargs):
     task = AsyncResult(task_id)
 
     if task.successful():
-        return Response({"status": task.status, "result": task.result}, status=200)
+        return Response({"status": task.status, "phase": "final", "result": task.result}, status=200)
     elif task.failed():
         return Response({"status": task.status, "result": task.result}, status=500)
     
+    photo_progress = get_progress(task_id)
+    if photo_progress is not None:
+        return Response({"status": task.status, "phase": photo_progress["phase"], "result": {"num_faces": photo_progress["num_faces"], "image_url": "", "progress": photo_progress}}, status=202)
+
     return Response({"status": task.status,"result":{"num_faces":0,"image_url":""}}, status=202)
 
 @api_view(["GET"])
@@ -764,7 +987,7 @@ def update_notification_token(request, *args, **kwargs):
 
         student = get_object_or_404(Student, id=student_id)
         student.notification_token = notification_token
-        student.save()
+        student.save(update_fields=['notification_token'])
 
         return Response(
             {"message": "Notification token updated successfully"},
@@ -796,7 +1019,7 @@ def remove_notification_token(request, *args, **kwargs):
 
         student = get_object_or_404(Student, id=student_id)
         student.notification_token = None
-        student.save()
+        student.save(update_fields=['notification_token'])
 
         return Response(
             {"message": "Notification token removed successfully"},
@@ -0,0 +1,150 @@
+"""
+CPU layout of the Celery worker.
+
+Under prefork, every child otherwise starts torch, TensorFlow, OpenCV and the
+BLAS/OpenMP runtimes with one thread per core, so N children on C cores run
+N*C busy threads. `plan()` runs in the worker's main process from worker_init
+(before the face models are warmed up there) and divides the usable cores
+between the children; `apply_to_child()` runs in every pool process from
+worker_process_init and sets that child's thread counts and, with
+settings.WORKER_CPU_PIN, its CPU affinity. Non-prefork pools (gevent,
+threads, solo) run everything in one process, which gets all the cores.
+
+settings.WORKER_CPU_POLICY:
+
+- "split": cores // children threads per child (at least one).
+- "fixed": settings.WORKER_THREADS_PER_CHILD threads per child.
+- "off": leave every library at its default.
+"""
+import logging
+import os
+import sys
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Read by OpenMP, MKL, OpenBLAS and TensorFlow when they initialise.
+_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+)
+
+_layout = None
+
+
+def _usable_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _is_prefork(worker):
+    pool_cls = getattr(worker, "pool_cls", None)
+    name = pool_cls if isinstance(pool_cls, str) else getattr(pool_cls, "__module__", "")
+    return "prefork" in (name or "")
+
+
+def plan(worker):
+    """
+    Work out the layout for `worker` (the worker_init sender) and export
+    the per-child thread counts to the environment, so runtimes initialised
+    in the main process or the children pick them up.
+    """
+    global _layout
+
+    policy = settings.WORKER_CPU_POLICY
+    if policy == "off":
+        return None
+
+    cpus = _usable_cpus()
+    children = max(1, int(getattr(worker, "concurrency", 1) or 1)) if _is_prefork(worker) else 1
+    if policy == "fixed":
+        threads = max(1, settings.WORKER_THREADS_PER_CHILD)
+    else:
+        threads = max(1, len(cpus) // children)
+
+    _layout = {
+        "cpus": cpus,
+        "children": children,
+        "threads": threads,
+        "pin": settings.WORKER_CPU_PIN and children > 1,
+    }
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+
+    logger.info(
+        "Worker CPU layout: %d cpus, %d children x %d threads, policy %s, pinning %s",
+        len(cpus), children, threads, policy, "on" if _layout["pin"] else "off",
+    )
+    if children == 1:
+        apply_to_child(index=0)
+    return _layout
+
+
+def threads_per_child():
+    """
+    Threads each pool process should use, or None without a layout.
+    """
+    return _layout["threads"] if _layout else None
+
+
+def _child_cpus(index):
+    cpus, threads = _layout["cpus"], _layout["threads"]
+    start = (index * threads) % len(cpus)
+    return [cpus[(start + offset) % len(cpus)] for offset in range(min(threads, len(cpus)))]
+
+
+def _child_index():
+    from billiard.process import current_process
+
+    # Prefork pool processes are numbered 1..concurrency.
+    return max(int(getattr(current_process(), "index", 1) or 1) - 1, 0)
+
+
+def apply_to_child(index=None):
+    """
+    Set this process's thread counts (and affinity, when pinning) from the
+    layout planned in the main process.
+    """
+    if _layout is None:
+        return None
+    index = _child_index() if index is None else index
+    threads = _layout["threads"]
+
+    pinned = None
+    if _layout["pin"] and hasattr(os, "sched_setaffinity"):
+        pinned = _child_cpus(index)
+        os.sched_setaffinity(0, pinned)
+
+    import cv2
+    cv2.setNumThreads(threads)
+
+    # Libraries not imported yet read the environment set in plan().
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Only settable before the first parallel op.
+            pass
+
+    if "tensorflow" in sys.modules:
+        tf = sys.modules["tensorflow"]
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError:
+            # Already initialised in the main process, where it picked up
+            # TF_NUM_INTRAOP_THREADS instead.
+            pass
+
+    logger.info(
+        "Worker child %d (pid %s): %d threads, cpus %s",
+        index, os.getpid(), threads, pinned if pinned is not None else "unpinned",
+    )
+    return {"index": index, "threads": threads, "cpus": pinned}